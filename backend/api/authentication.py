@@ -0,0 +1,84 @@
+import copy
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from recipes.catalogue import bump_tokens_version, get_tokens_version
+from recipes.constants import TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL
+from recipes.models import User
+
+
+class TokenCache:
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def delete_user(self, user_id):
+        with self.lock:
+            for key in [
+                key for key, (_, (user, _, _)) in self.entries.items()
+                if user.id == user_id
+            ]:
+                del self.entries[key]
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        # Версия меняется при выходе и блокировке пользователя в любом
+        # процессе, поэтому устаревшие записи других воркеров не действуют.
+        version = get_tokens_version()
+        cached = token_cache.get(key)
+        if cached is None or cached[2] != version:
+            cached = (*super().authenticate_credentials(key), version)
+            token_cache.set(key, cached)
+        user, token, _ = cached
+        return copy.copy(user), copy.copy(token)
+
+
+@receiver(post_delete, sender=Token)
+def forget_token(sender, instance, **kwargs):
+    token_cache.delete(instance.key)
+    transaction.on_commit(bump_tokens_version)
+
+
+@receiver((post_save, post_delete), sender=User)
+def forget_user_tokens(sender, instance, **kwargs):
+    token_cache.delete_user(instance.id)
+    if not instance.is_active:
+        transaction.on_commit(bump_tokens_version)
@@ -0,0 +1,45 @@
+from functools import wraps
+from hashlib import md5
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from recipes.catalogue import load_version
+from recipes.constants import RECIPES_RESPONSE_CACHE_KEY, RECIPES_VERSION_KEY
+
+
+def cache_anonymous_response(method):
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return method(self, request, *args, **kwargs)
+        version, modified = load_version(RECIPES_VERSION_KEY)
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        request_hash = md5(
+            f'{request.scheme}://{request.get_host()}{request.path}?{query}'
+            f'|{request.accepted_renderer.format}'
+            .encode()
+        ).hexdigest()
+        etag = f'"{md5(f"{version}|{request_hash}".encode()).hexdigest()}"'
+        last_modified = int(modified.timestamp()) if modified else None
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            key = RECIPES_RESPONSE_CACHE_KEY.format(version, request_hash)
+            data = cache.get(key)
+            if data is not None:
+                response = Response(data)
+            else:
+                response = method(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                cache.set(key, response.data)
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+    return wrapper
@@ -0,0 +1,83 @@
+import asyncio
+from contextvars import ContextVar
+from functools import partial, update_wrapper
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import prefetch_related_objects
+
+from foodgram_backend.middleware import track_queries
+
+_concurrent = ContextVar('concurrent_queries', default=False)
+
+
+def run_query(func):
+    # Каждый поток пула работает со своим соединением с базой, поэтому
+    # соединения закрываются по тем же правилам, что и после запроса.
+    close_old_connections()
+    try:
+        with track_queries():
+            return func()
+    finally:
+        close_old_connections()
+
+
+async def gather_queries(funcs):
+    return await asyncio.gather(*(
+        sync_to_async(run_query, thread_sensitive=False)(func)
+        for func in funcs
+    ))
+
+
+def run_concurrently(*funcs):
+    """Выполняет независимые запросы к базе параллельно.
+
+    Параллельно запросы идут только в асинхронных представлениях и вне
+    транзакции, изменения которой не видны другим соединениям.
+    """
+    if len(funcs) < 2 or not _concurrent.get() or connection.in_atomic_block:
+        return [func() for func in funcs]
+    return async_to_sync(gather_queries)(funcs)
+
+
+def fetch_concurrently(queryset):
+    """Загружает строки, а затем связанные объекты всех
+    prefetch_related одновременно, а не по очереди."""
+    lookups = queryset._prefetch_related_lookups
+    if len(lookups) < 2 or not _concurrent.get():
+        return list(queryset)
+    results = list(queryset.prefetch_related(None))
+    # Иначе потоки могут одновременно создать кэш у одного объекта
+    # и потерять загруженные другим потоком связи.
+    for obj in results:
+        obj._prefetched_objects_cache = {}
+    run_concurrently(*(
+        partial(prefetch_related_objects, results, lookup)
+        for lookup in lookups
+    ))
+    return results
+
+
+class AsyncViewMixin:
+    """Отдаёт асинхронное представление, если включён ASYNC_VIEWS.
+
+    Каждый запрос выполняется в своём потоке пула со своим соединением
+    с базой, а не в общем потоке для синхронного кода, через который
+    запросы прошли бы по одному.
+    """
+
+    @classmethod
+    def as_view(cls, *args, **kwargs):
+        view = super().as_view(*args, **kwargs)
+        if not settings.ASYNC_VIEWS:
+            return view
+        sync_view = sync_to_async(run_query, thread_sensitive=False)
+
+        async def async_view(request, *args, **kwargs):
+            token = _concurrent.set(True)
+            try:
+                return await sync_view(partial(view, request, *args, **kwargs))
+            finally:
+                _concurrent.reset(token)
+        return update_wrapper(async_view, view)
@@ -1,15 +1,41 @@
 import base64
+import binascii
 
-from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
 from rest_framework import serializers
 
 import api.serializers
+from recipes.catalogue import get_catalogue
+from recipes.constants import IMAGE_DECODE_CHUNK_SIZE, MAX_IMAGE_SIZE
+from recipes.images import rendition_name
+from recipes.models import Tag
 
 
 class TagFieldSerializer(serializers.PrimaryKeyRelatedField):
+    def get_catalogue(self):
+        # Каталог запоминается на время обработки запроса, чтобы не
+        # проверять его версию для каждого тега каждого рецепта.
+        if not hasattr(self, '_catalogue'):
+            self._catalogue = get_catalogue()
+        return self._catalogue
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            tag = self.get_catalogue().tags_by_id[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        return Tag.from_db(self.get_queryset().db, tag._fields, tag)
+
     def to_representation(self, value):
-        serializer = api.serializers.TagSerializer(value)
-        return serializer.data
+        tag = self.get_catalogue().tags_by_id.get(value.pk)
+        if tag is None:
+            return api.serializers.TagSerializer(value).data
+        return tag._asdict()
 
 
 class Base64ImageField(serializers.ImageField):
@@ -17,7 +43,40 @@ class Base64ImageField(serializers.ImageField):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            if len(imgstr) * 3 // 4 > MAX_IMAGE_SIZE:
+                raise serializers.ValidationError(
+                    'Размер изображения не может превышать '
+                    f'{MAX_IMAGE_SIZE // 1024 // 1024} МБ'
+                )
+            data = TemporaryUploadedFile(
+                'temp.' + ext, format.split(':')[-1], 0, None
+            )
+            try:
+                for start in range(0, len(imgstr), IMAGE_DECODE_CHUNK_SIZE):
+                    data.write(base64.b64decode(
+                        imgstr[start:start + IMAGE_DECODE_CHUNK_SIZE],
+                        validate=True
+                    ))
+            except binascii.Error:
+                data.close()
+                raise serializers.ValidationError(
+                    'Изображение должно быть в кодировке base64'
+                )
+            data.size = data.tell()
+            data.seek(0)
 
         return super().to_internal_value(data)
+
+
+class ThumbnailImageField(serializers.ImageField):
+    def to_representation(self, value):
+        if not value:
+            return None
+        thumbnail = rendition_name(value.name, 'small')
+        if not default_storage.exists(thumbnail):
+            return super().to_representation(value)
+        url = default_storage.url(thumbnail)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
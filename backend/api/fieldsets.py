@@ -0,0 +1,84 @@
+from rest_framework.exceptions import ValidationError
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def parse_names(request, param, allowed):
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    names = tuple(dict.fromkeys(
+        name.strip() for name in value.split(',') if name.strip()
+    ))
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise ValidationError({
+            param: [f'Неизвестные поля: {", ".join(unknown)}']
+        })
+    return names
+
+
+class SparseFieldsetMixin:
+    """Оставляет в ответе только поля из fields.
+
+    Вложенные объекты из collapsible_fields, не перечисленные в expand,
+    отдаются в виде id.
+    """
+    collapsible_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        if expand is not None:
+            for name in self.collapsible_fields:
+                if name in self.fields and name not in expand:
+                    self.fields[name] = self.get_collapsed_field(name)
+
+    def get_collapsed_field(self, name):
+        raise NotImplementedError
+
+
+class SparseFieldsetViewMixin:
+
+    def get_fieldset(self):
+        if not hasattr(self, '_fieldset'):
+            serializer_class = self.get_serializer_class()
+            if self.request.method != 'GET' or not issubclass(
+                serializer_class, SparseFieldsetMixin
+            ):
+                self._fieldset = None, None
+            else:
+                self._fieldset = (
+                    parse_names(
+                        self.request,
+                        FIELDS_PARAM,
+                        serializer_class.Meta.fields
+                    ),
+                    parse_names(
+                        self.request,
+                        EXPAND_PARAM,
+                        serializer_class.collapsible_fields
+                    ),
+                )
+        return self._fieldset
+
+    def is_requested(self, name):
+        fields, _ = self.get_fieldset()
+        return fields is None or name in fields
+
+    def is_expanded(self, name):
+        _, expand = self.get_fieldset()
+        return self.is_requested(name) and (expand is None or name in expand)
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.get_fieldset()
+        if fields is not None:
+            kwargs['fields'] = fields
+        if expand is not None:
+            kwargs['expand'] = expand
+        return super().get_serializer(*args, **kwargs)
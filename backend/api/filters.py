@@ -1,25 +1,64 @@
+from django.db import connection
+from django.db.models import Case, IntegerField, Value, When
 from django_filters import rest_framework as filters
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
 
-from recipes.models import Recipe, Tag
+from recipes.catalogue import get_catalogue
+from recipes.constants import INGREDIENTS_SEARCH_LIMIT, RECIPE_ORDERINGS
+from recipes.models import Ingredient, Recipe
+from recipes.search import search_recipes
+
+
+def tag_choices():
+    return [(slug, slug) for slug in get_catalogue().tags_by_slug]
 
 
 class RecipesFilter(filters.FilterSet):
-    author = filters.NumberFilter(
-        field_name='author__id', lookup_expr='icontains'
-    )
-    tags = filters.ModelMultipleChoiceFilter(
-        queryset=Tag.objects.all(),
-        field_name='tags__slug',
-        to_field_name='slug'
+    author = filters.CharFilter(method='author_filter')
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices, method='tags_filter'
     )
     is_favorited = filters.NumberFilter(method='is_favorited_filter')
     is_in_shopping_cart = filters.NumberFilter(
         method='is_in_shopping_cart_filter'
     )
+    search = filters.CharFilter(method='search_filter')
+    ordering = filters.ChoiceFilter(
+        choices=[(ordering, ordering) for ordering in RECIPE_ORDERINGS],
+        method='ordering_filter'
+    )
 
     class Meta:
         models = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author',
+            'tags',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'search',
+            'ordering',
+        )
+
+    def author_filter(self, queryset, name, value):
+        authors = set()
+        for author in value.split(','):
+            if author == 'me' and self.request.user.is_authenticated:
+                authors.add(self.request.user.id)
+            elif author.isdigit():
+                authors.add(int(author))
+            elif author != 'me':
+                raise ValidationError(
+                    {'author': f'Некорректный id автора: {author}'}
+                )
+        return queryset.filter(author__in=authors)
+
+    def tags_filter(self, queryset, name, value):
+        tags = get_catalogue().tags_by_slug
+        return queryset.filter(
+            tags__in=[tags[slug].id for slug in value]
+        ).distinct()
 
     def is_favorited_filter(self, queryset, name, value):
         if not value or self.request.user.is_anonymous:
@@ -30,3 +69,34 @@ class RecipesFilter(filters.FilterSet):
         if not value or self.request.user.is_anonymous:
             return queryset
         return queryset.filter(shopping_carts__author=self.request.user)
+
+    def search_filter(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def ordering_filter(self, queryset, name, value):
+        return queryset.order_by(f'-{RECIPE_ORDERINGS[value]}', '-id')
+
+
+class IngredientSearchFilter(BaseFilterBackend):
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params['limit'])
+        except (KeyError, ValueError):
+            return INGREDIENTS_SEARCH_LIMIT
+        return min(max(limit, 1), INGREDIENTS_SEARCH_LIMIT)
+
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get(api_settings.SEARCH_PARAM)
+        if not name or view.action != 'list':
+            return queryset
+        limit = self.get_limit(request)
+        if connection.vendor != 'postgresql':
+            return get_catalogue().search_ingredients(name, limit)
+        return Ingredient.objects.filter(name__icontains=name).annotate(
+            is_not_prefix=Case(
+                When(name__istartswith=name, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField()
+            )
+        ).order_by('is_not_prefix', 'name')[:limit]
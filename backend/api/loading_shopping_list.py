@@ -1,12 +1,63 @@
 import csv
 
+from django.core.cache import cache
+from django.db.models import Sum
 
-def download_file(response, ingredients):
-    writer = csv.writer(response, delimiter=' ', quotechar='|')
-    for ingredient in ingredients:
-        writer.writerow([
-            f'{ingredient.get("ingredient__name")} '
-            f'({ingredient.get("ingredient__measurement_unit")}) - '
-            f'{ingredient.get("amount")}'
-        ])
-    return writer
+from recipes.constants import (SHOPPING_CART_CACHE_KEY,
+                               SHOPPING_CART_CACHE_MAX_ROWS)
+from recipes.models import IngredientRecipe
+
+FILE_FORMATS = {
+    'txt': ('text/plain', 'recipe.txt'),
+    'csv': ('text/csv', 'recipe.csv'),
+}
+CSV_HEADER = ('Ингредиент', 'Единица измерения', 'Количество')
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def get_ingredients(user):
+    key = SHOPPING_CART_CACHE_KEY.format(user.id)
+    ingredients = cache.get(key)
+    if ingredients is not None:
+        yield from ingredients
+        return
+    ingredients = []
+    for row in IngredientRecipe.objects.filter(
+        recipe__shopping_carts__author=user
+    ).values_list(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).annotate(
+        amount=Sum('amount')
+    ).order_by(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).iterator():
+        if ingredients is not None:
+            ingredients.append(row)
+            if len(ingredients) > SHOPPING_CART_CACHE_MAX_ROWS:
+                ingredients = None
+        yield row
+    if ingredients is not None:
+        cache.set(key, ingredients)
+
+
+def txt_lines(ingredients):
+    for name, measurement_unit, amount in ingredients:
+        yield f'{name} ({measurement_unit}) - {amount}\n'
+
+
+def csv_lines(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in ingredients:
+        yield writer.writerow(row)
+
+
+def download_file(user, file_format):
+    lines = csv_lines if file_format == 'csv' else txt_lines
+    yield '\ufeff'.encode()
+    for line in lines(get_ingredients(user)):
+        yield line.encode()
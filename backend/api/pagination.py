@@ -1,5 +1,135 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.core.paginator import InvalidPage
+from django.db.models import F, Q, QuerySet
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from api.concurrency import fetch_concurrently, run_concurrently
+from recipes.constants import MAX_PAGE_SIZE, RECIPE_ORDERINGS
 
 
 class CustomPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+
+    def get_concurrent_queries(self, view):
+        if not hasattr(view, 'get_concurrent_queries'):
+            return ()
+        return view.get_concurrent_queries()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Количество, строки страницы и запросы представления не зависят
+        # друг от друга, поэтому выполняются одновременно.
+        page_size = self.get_page_size(request)
+        try:
+            start = (
+                int(request.query_params.get(self.page_query_param, 1)) - 1
+            ) * page_size
+        except (TypeError, ValueError):
+            start = -1
+        if start < 0 or not isinstance(queryset, QuerySet):
+            return super().paginate_queryset(queryset, request, view)
+        count, results, *_ = run_concurrently(
+            queryset.count,
+            lambda: fetch_concurrently(queryset[start:start + page_size]),
+            *self.get_concurrent_queries(view)
+        )
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.count = count
+        page_number = request.query_params.get(self.page_query_param, 1)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            ))
+        self.page.object_list = results
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        self.request = request
+        return results
+
+
+class RecipePagination(CustomPagination):
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    search_query_param = 'search'
+    default_ordering = 'pub_date'
+
+    def get_ordering_field(self, request):
+        return RECIPE_ORDERINGS.get(
+            request.query_params.get(self.ordering_query_param),
+            RECIPE_ORDERINGS[self.default_ordering]
+        )
+
+    def encode_cursor(self, recipe):
+        value = recipe.cursor_value
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        position = json.dumps([value, recipe.id])
+        return urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, request, field):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            value, pk = json.loads(urlsafe_b64decode(cursor.encode()))
+            if field == RECIPE_ORDERINGS[self.default_ordering]:
+                return datetime.fromisoformat(value), int(pk)
+            return float(value), int(pk)
+        except (TypeError, ValueError):
+            raise NotFound('Некорректный курсор')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Результаты поиска без явной сортировки упорядочены по
+        # релевантности, поэтому листаются по номеру страницы.
+        self.use_cursor = self.cursor_query_param in request.query_params and (
+            self.ordering_query_param in request.query_params
+            or self.search_query_param not in request.query_params
+        )
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        page_size = self.get_page_size(request)
+        field = self.get_ordering_field(request)
+        cursor = self.decode_cursor(request, field)
+        queryset = queryset.annotate(cursor_value=F(field)).order_by(
+            f'-{field}', '-id'
+        )
+        if cursor is not None:
+            value, pk = cursor
+            queryset = queryset.filter(
+                Q(**{f'{field}__lt': value})
+                | Q(**{field: value, 'pk__lt': pk})
+            )
+        results, *_ = run_concurrently(
+            lambda: fetch_concurrently(queryset[:page_size + 1]),
+            *self.get_concurrent_queries(view)
+        )
+        self.next_recipe = (
+            results[page_size - 1] if len(results) > page_size else None
+        )
+        return results[:page_size]
+
+    def get_next_cursor_link(self):
+        if self.next_recipe is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_recipe)
+        )
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_cursor_link(),
+            'results': data
+        })
@@ -0,0 +1,76 @@
+from collections import OrderedDict
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+
+# Поля, у которых to_representation сводится к приведению типа.
+# Подклассы сюда не попадают, так как могут переопределять вывод.
+CONVERTERS = {
+    serializers.CharField: str,
+    serializers.EmailField: str,
+    serializers.SlugField: str,
+    serializers.IntegerField: int,
+    serializers.ReadOnlyField: None,
+}
+
+
+def get_representation(field, instance):
+    try:
+        attribute = field.get_attribute(instance)
+    except SkipField:
+        return SkipField
+    if isinstance(attribute, PKOnlyObject):
+        if attribute.pk is None:
+            return None
+    elif attribute is None:
+        return None
+    return field.to_representation(attribute)
+
+
+def compile_field(serializer, field):
+    if isinstance(field, serializers.SerializerMethodField):
+        return getattr(serializer, field.method_name)
+    if type(field) not in CONVERTERS:
+        return lambda instance: get_representation(field, instance)
+    getter = attrgetter(field.source)
+    converter = CONVERTERS[type(field)]
+
+    def represent(instance):
+        try:
+            value = getter(instance)
+        except (AttributeError, ObjectDoesNotExist):
+            return get_representation(field, instance)
+        if value is None or converter is None:
+            return value
+        return converter(value)
+    return represent
+
+
+class FastRepresentationMixin:
+    """Собирает ответ через заранее подготовленные функции доступа к полям.
+
+    Результат совпадает с обычным to_representation, но без
+    обхода полей сериализатора для каждого объекта.
+    """
+
+    def get_compiled_fields(self):
+        if not hasattr(self, '_compiled_fields'):
+            self._compiled_fields = [
+                (field.field_name, compile_field(self, field))
+                for field in self._readable_fields
+            ]
+        return self._compiled_fields
+
+    def to_representation(self, instance):
+        if not settings.FAST_REPRESENTATION:
+            return super().to_representation(instance)
+        ret = OrderedDict()
+        for name, represent in self.get_compiled_fields():
+            value = represent(instance)
+            if value is not SkipField:
+                ret[name] = value
+        return ret
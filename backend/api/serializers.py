@@ -1,15 +1,24 @@
+from django.conf import settings
+from django.contrib.auth.hashers import check_password
 from django.contrib.auth.password_validation import validate_password
-from django.shortcuts import get_object_or_404
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 
 from api import fields
+from api.fieldsets import SparseFieldsetMixin
+from api.representation import FastRepresentationMixin
 from recipes.constants import (MAX_LEN_EMAIL, MAX_LEN_FIRST_LAST_NAME,
                                MAX_LEN_PASSWORD)
+from recipes.membership import get_membership
 from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Subscription, Tag, User)
+                            ShoppingCart, Tag, User, UserCounter)
 
 
-class UserListSerializer(serializers.ModelSerializer):
+class UserListSerializer(
+    SparseFieldsetMixin, FastRepresentationMixin, serializers.ModelSerializer
+):
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -25,11 +34,7 @@ class UserListSerializer(serializers.ModelSerializer):
         read_only_true = ('username',)
 
     def get_is_subscribed(self, value):
-        request = self.context.get('request')
-        subscribed = Subscription.objects.filter(
-            following=value.id, user=request.user.id
-        ).exists()
-        return subscribed
+        return get_membership(self.context).is_subscribed(value.id)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -101,30 +106,36 @@ class TokenSerializer(serializers.Serializer):
         model = User
         fields = ('password', 'email')
 
-    def validate_email(self, data):
-        if not User.objects.filter(email=data):
+    def validate(self, data):
+        user = User.objects.select_related('auth_token').filter(
+            email=data['email']
+        ).first()
+        if user is None:
             raise serializers.ValidationError(
-                'Введен некорректный email!'
+                {'email': ['Введен некорректный email!']}
             )
-        return data
-
-    def validate(self, data):
-        user = get_object_or_404(User, email=data['email'])
-        if not user.check_password(data['password']):
+        if settings.PASSWORD_UPGRADE_ON_LOGIN:
+            valid = user.check_password(data['password'])
+        else:
+            valid = check_password(data['password'], user.password)
+        if not valid:
             raise serializers.ValidationError(
                 'Введен некорректный пароль!'
             )
+        data['user'] = user
         return data
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(FastRepresentationMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Tag
         fields = ('id', 'name', 'color', 'slug')
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(
+    FastRepresentationMixin, serializers.ModelSerializer
+):
 
     class Meta:
         model = Ingredient
@@ -134,54 +145,51 @@ class IngredientSerializer(serializers.ModelSerializer):
 class FavoriteShoppingCartSerializer(serializers.ModelSerializer):
     name = serializers.ReadOnlyField(source='recipe.name')
     cooking_time = serializers.ReadOnlyField(source='recipe.cooking_time')
-    image = serializers.SerializerMethodField()
+    image = fields.ThumbnailImageField(source='recipe.image', read_only=True)
+    duplicate_error = None
 
     class Meta:
         fields = ('id', 'name', 'image', 'cooking_time')
 
-    def get_image(self, value):
-        return str(value.recipe.image)
-
     def validate(self, value):
         recipe_id = self.context.get('view').kwargs.get('recipe_id')
-        if not Recipe.objects.filter(id=recipe_id).exists():
+        recipe = Recipe.objects.only(
+            'id', 'name', 'image', 'cooking_time'
+        ).filter(id=recipe_id).first()
+        if recipe is None:
             raise serializers.ValidationError(
                 'Рецепта с таким id не существует'
             )
+        value['recipe'] = recipe
         return value
 
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [self.duplicate_error]}
+            )
+
 
 class ShoppingCartSerializer(FavoriteShoppingCartSerializer):
+    duplicate_error = 'Нельзя повторно добавить рецепт в корзину'
 
     class Meta(FavoriteShoppingCartSerializer.Meta):
         model = ShoppingCart
 
-    def validate(self, value):
-        request = self.context.get('request')
-        recipe_id = self.context.get('view').kwargs.get('recipe_id')
-        if ShoppingCart.objects.filter(author=request.user, recipe=recipe_id):
-            raise serializers.ValidationError(
-                'Нельзя повторно добавить рецепт в корзину'
-            )
-        return super().validate(value)
-
 
 class FavoriteSerializer(FavoriteShoppingCartSerializer):
+    duplicate_error = 'Нельзя повторно добавить рецепт в избранное'
 
     class Meta(FavoriteShoppingCartSerializer.Meta):
         model = Favorite
 
-    def validate(self, value):
-        request = self.context.get('request')
-        recipe_id = self.context.get('view').kwargs.get('recipe_id')
-        if Favorite.objects.filter(author=request.user, recipe=recipe_id):
-            raise serializers.ValidationError(
-                'Нельзя повторно добавить рецепт в избранное'
-            )
-        return super().validate(value)
 
-
-class IngredientRecipeSerializer(serializers.ModelSerializer):
+class IngredientRecipeSerializer(
+    FastRepresentationMixin, serializers.ModelSerializer
+):
     id = serializers.ReadOnlyField(source='ingredient.id')
     name = serializers.ReadOnlyField(source='ingredient.name')
     measurement_unit = serializers.ReadOnlyField(
@@ -193,10 +201,16 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class IngredientAmountSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(source='ingredient_id')
+
+    class Meta:
+        model = IngredientRecipe
+        fields = ('id', 'amount')
+
+
 class IngredientRecipeWriteAndUpdateSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all()
-    )
+    id = serializers.IntegerField()
     amount = serializers.IntegerField()
 
     class Meta:
@@ -204,7 +218,9 @@ class IngredientRecipeWriteAndUpdateSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(
+    SparseFieldsetMixin, FastRepresentationMixin, serializers.ModelSerializer
+):
     tags = fields.TagFieldSerializer(
         many=True,
         queryset=Tag.objects.all(),
@@ -231,20 +247,34 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('author',)
 
+    collapsible_fields = ('tags', 'author', 'ingredients')
+
+    def get_collapsed_field(self, name):
+        if name == 'ingredients':
+            return IngredientAmountSerializer(many=True, source='recips')
+        return serializers.PrimaryKeyRelatedField(
+            many=name == 'tags', read_only=True
+        )
+
     def get_is_favorited(self, value):
-        request = self.context.get('request')
-        is_favorited = Favorite.objects.filter(
-            author=request.user.id, recipe=value.id
-        ).exists()
-        return is_favorited
+        return get_membership(self.context).is_favorited(value.id)
 
     def get_is_in_shopping_cart(self, value):
-        request = self.context.get('request')
-        is_in_shopping_cart = ShoppingCart.objects.filter(
-            author=request.user.id,
-            recipe=value.id
-        ).exists()
-        return is_in_shopping_cart
+        return get_membership(self.context).is_in_shopping_cart(value.id)
+
+
+class RecipeMatchSerializer(RecipeSerializer):
+    matched_ingredients = serializers.ReadOnlyField(source='match.matched')
+    total_ingredients = serializers.ReadOnlyField(source='match.total')
+    coverage = serializers.SerializerMethodField()
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + (
+            'matched_ingredients', 'total_ingredients', 'coverage'
+        )
+
+    def get_coverage(self, value):
+        return round(value.match.matched / value.match.total, 2)
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
@@ -304,6 +334,15 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                     'Ингредиенты должны быть уникальны'
                 )
             ingredients.append(ingredient.get('id'))
+        missing = set(ingredients).difference(
+            Ingredient.objects.filter(
+                id__in=ingredients
+            ).values_list('id', flat=True)
+        )
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиентов с id {sorted(missing)} не существует'
+            )
         return value
 
     def validate_cooking_time(self, value):
@@ -323,19 +362,51 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             )
         return value
 
+    def create_ingredients(self, recipe, ingredients):
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
+                recipe=recipe,
+                ingredient_id=ingredient['id'],
+                amount=ingredient['amount']
+            )
+            for ingredient in ingredients
+        )
+
+    def update_ingredients(self, recipe, ingredients):
+        current = {
+            ingredient_recipe.ingredient_id: ingredient_recipe
+            for ingredient_recipe in recipe.recips.all()
+        }
+        created, updated = [], []
+        for ingredient in ingredients:
+            ingredient_recipe = current.pop(ingredient['id'], None)
+            if ingredient_recipe is None:
+                created.append(ingredient)
+            elif ingredient_recipe.amount != ingredient['amount']:
+                ingredient_recipe.amount = ingredient['amount']
+                updated.append(ingredient_recipe)
+        if current:
+            IngredientRecipe.objects.filter(
+                id__in=[
+                    ingredient_recipe.id
+                    for ingredient_recipe in current.values()
+                ]
+            ).delete()
+        if updated:
+            IngredientRecipe.objects.bulk_update(updated, ('amount',))
+        if created:
+            self.create_ingredients(recipe, created)
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
-        for ingredient in ingredients:
-            IngredientRecipe.objects.create(
-                recipe=recipe,
-                ingredient=ingredient['id'],
-                amount=ingredient['amount']
-            )
+        self.create_ingredients(recipe, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         instance.name = validated_data.get('name', instance.name)
         instance.text = validated_data.get('text', instance.text)
@@ -346,29 +417,59 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         instance.tags.set(tags)
-        IngredientRecipe.objects.filter(recipe=instance).delete()
-        for ingredient in ingredients:
-            IngredientRecipe.objects.create(
-                recipe=instance,
-                ingredient=ingredient['id'],
-                amount=ingredient['amount']
-            )
-        instance.save()
+        self.update_ingredients(instance, ingredients)
+        instance.save(
+            update_fields=('name', 'text', 'cooking_time', 'image')
+        )
         return instance
 
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
     def to_representation(self, instance):
+        # Ингредиенты и теги могли измениться после загрузки рецепта.
+        instance._prefetched_objects_cache = {}
+        prefetch_related_objects(
+            [instance],
+            Prefetch(
+                'recips',
+                queryset=IngredientRecipe.objects.select_related('ingredient')
+            ),
+            'tags'
+        )
         return RecipeSerializer(instance, context={
             'request': self.context.get('request')
         }).data
 
 
 class RecipeForSubscriptionSerializer(serializers.ModelSerializer):
+    image = fields.ThumbnailImageField(read_only=True)
 
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
+def get_recipes_limit(request):
+    recipes_limit = request.query_params.get('recipes_limit')
+    if not recipes_limit:
+        return None
+    try:
+        recipes_limit = int(recipes_limit)
+    except ValueError:
+        recipes_limit = -1
+    if recipes_limit < 0:
+        raise serializers.ValidationError({
+            'recipes_limit': ['Укажите целое неотрицательное число']
+        })
+    return recipes_limit
+
+
 class SubscriptionsSerializer(UserListSerializer):
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField()
@@ -379,20 +480,31 @@ class SubscriptionsSerializer(UserListSerializer):
             'email', 'username', 'first_name', 'last_name', 'is_subscribed'
         )
 
+    collapsible_fields = ('recipes',)
+
+    def get_collapsed_field(self, name):
+        return serializers.PrimaryKeyRelatedField(
+            many=True, read_only=True, source='limited_recipes'
+        )
+
     def get_recipes(self, value):
-        request = self.context.get('request')
-        recipes_limit = request.query_params.get('recipes_limit')
-        if recipes_limit:
-            recipes = Recipe.objects.filter(
-                author=value.id
-            )[:int(recipes_limit)]
-        else:
-            recipes = Recipe.objects.filter(author=value.id)
+        if hasattr(value, 'limited_recipes'):
+            serializer = RecipeForSubscriptionSerializer(
+                value.limited_recipes, many=True
+            )
+            return serializer.data
+        recipes = Recipe.objects.filter(author=value.id)
+        recipes_limit = get_recipes_limit(self.context.get('request'))
+        if recipes_limit is not None:
+            recipes = recipes[:recipes_limit]
         serializer = RecipeForSubscriptionSerializer(recipes, many=True)
         return serializer.data
 
     def get_recipes_count(self, value):
-        return Recipe.objects.filter(author=value.id).count()
+        try:
+            return value.counter.recipes_count
+        except UserCounter.DoesNotExist:
+            return Recipe.objects.filter(author=value.id).count()
 
     def validate(self, value):
         user = self.context.get('request').user.id
@@ -400,10 +512,6 @@ class SubscriptionsSerializer(UserListSerializer):
             'request'
         ).parser_context.get('kwargs').get('pk')
 
-        if Subscription.objects.filter(user=user, following=author).exists():
-            raise serializers.ValidationError(
-                'Подписка на автора уже форомлена'
-            )
         if int(author) == user:
             raise serializers.ValidationError(
                 'Нельзя подписываться на самого себя'
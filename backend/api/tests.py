@@ -0,0 +1,996 @@
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import (APIClient, APIRequestFactory,
+                                 force_authenticate)
+
+from api import concurrency
+from api.authentication import token_cache
+from api.throttling import LoginEmailThrottle, LoginIPThrottle
+from api.views import RecipeViewSet
+from recipes import catalogue, matching, search
+from recipes.catalogue import bump_matching_version
+from recipes.constants import SHOPPING_CART_CACHE_KEY
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            RecipeScore, ShoppingCart, Subscription, Tag, User,
+                            UserCounter)
+
+RECIPES_COUNT = 60
+
+
+class APITestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                username=f'user{i}',
+                email=f'user{i}@example.com',
+                password='Pa55word!x',
+                first_name='Имя',
+                last_name='Фамилия'
+            )
+            for i in range(3)
+        ]
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {i}', color='#E26C2D', slug=f'tag{i}'
+            )
+            for i in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(5)
+        ]
+        for i in range(RECIPES_COUNT):
+            recipe = Recipe.objects.create(
+                author=cls.users[i % 2],
+                name=f'Рецепт {i}',
+                image='recipes/images/image.png',
+                text='Описание',
+                cooking_time=10 + i
+            )
+            recipe.tags.set(cls.tags[:i % 3 + 1])
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=i + 1
+                )
+                for ingredient in cls.ingredients[:i % 4 + 1]
+            )
+
+    def setUp(self):
+        # Версии данных откатываются вместе с транзакцией теста,
+        # поэтому индексы в памяти процесса собираются заново.
+        cache.clear()
+        catalogue._catalogue = None
+        matching._index = None
+        search._index = None
+        catalogue.get_catalogue()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+
+class RecipeListQueriesTest(APITestCase):
+    # Количество, страница, теги и ингредиенты страницы и версии данных.
+    # Авторизованный запрос ещё загружает избранное, корзину и подписки.
+    QUERIES = {False: 5, True: 8}
+
+    def test_recipe_list_queries(self):
+        for client in (self.anonymous, self.client):
+            authenticated = client is self.client
+            for limit in (6, 12, 50):
+                with self.subTest(limit=limit, authenticated=authenticated):
+                    cache.clear()
+                    with self.assertNumQueries(self.QUERIES[authenticated]):
+                        response = client.get(f'/api/recipes/?limit={limit}')
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(len(response.data['results']), limit)
+
+
+class CatalogueQueriesTest(APITestCase):
+
+    def test_catalogue_endpoints_read_versions_once(self):
+        for path in (
+            '/api/tags/',
+            f'/api/tags/{self.tags[0].id}/',
+            '/api/ingredients/',
+            '/api/ingredients/?name=ингр',
+            f'/api/ingredients/{self.ingredients[0].id}/',
+        ):
+            with self.subTest(path=path), self.assertNumQueries(1):
+                response = self.anonymous.get(path)
+                self.assertEqual(response.status_code, 200)
+
+
+class SubscriptionsTest(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        Subscription.objects.create(
+            user=self.users[0], following=self.users[1]
+        )
+        Subscription.objects.create(
+            user=self.users[0], following=self.users[2]
+        )
+
+    def test_recipes_limit(self):
+        response = self.client.get(
+            '/api/users/subscriptions/?recipes_limit=2'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [author['id'] for author in response.data['results']],
+            [self.users[1].id, self.users[2].id]
+        )
+        self.assertEqual(len(response.data['results'][0]['recipes']), 2)
+
+    def test_invalid_recipes_limit(self):
+        for recipes_limit in ('abc', '-1', '1.5'):
+            with self.subTest(recipes_limit=recipes_limit):
+                response = self.client.get(
+                    '/api/users/subscriptions/'
+                    f'?recipes_limit={recipes_limit}'
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('recipes_limit', response.data)
+
+
+class ShoppingCartFileTest(APITestCase):
+
+    def test_unsupported_format(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?file_type=pdf'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('txt, csv', response.data['errors'])
+
+
+class AuthorFilterTest(APITestCase):
+
+    def get_authors(self, client, author):
+        response = client.get(f'/api/recipes/?limit=100&author={author}')
+        self.assertEqual(response.status_code, 200)
+        return {recipe['author']['id'] for recipe in response.data['results']}
+
+    def test_me(self):
+        self.assertEqual(
+            self.get_authors(self.client, 'me'), {self.users[0].id}
+        )
+        self.assertEqual(self.get_authors(self.anonymous, 'me'), set())
+
+    def test_several_authors(self):
+        ids = {self.users[0].id, self.users[1].id}
+        self.assertEqual(
+            self.get_authors(self.anonymous, ','.join(map(str, ids))), ids
+        )
+        self.assertEqual(
+            self.get_authors(self.client, f'me,{self.users[1].id}'), ids
+        )
+
+    def test_invalid_author(self):
+        for author in ('abc', '1,x', '-1'):
+            with self.subTest(author=author):
+                response = self.anonymous.get(f'/api/recipes/?author={author}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('author', response.data)
+
+
+class CursorPaginationTest(APITestCase):
+
+    def walk(self, query):
+        ids = []
+        url = f'/api/recipes/?limit=7&cursor=&{query}'
+        while url:
+            response = self.anonymous.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 7)
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_pages_cover_all_recipes_once(self):
+        tagged = set(Recipe.objects.filter(
+            tags=self.tags[2]
+        ).values_list('id', flat=True))
+        for query, expected in (
+            ('', RECIPES_COUNT),
+            ('ordering=popular', RECIPES_COUNT),
+            ('ordering=trending', RECIPES_COUNT),
+            (f'tags={self.tags[2].slug}', len(tagged)),
+        ):
+            with self.subTest(query=query):
+                ids = self.walk(query)
+                self.assertEqual(len(ids), expected)
+                self.assertEqual(len(set(ids)), expected)
+        self.assertEqual(set(self.walk(f'tags={self.tags[2].slug}')), tagged)
+
+    def test_pages_follow_ordering(self):
+        first = self.anonymous.get(
+            '/api/recipes/?limit=7&ordering=trending'
+        ).data['results']
+        self.assertEqual(
+            self.walk('ordering=trending')[:7],
+            [recipe['id'] for recipe in first]
+        )
+
+    def test_malformed_cursor(self):
+        for cursor in ('!!!', 'bm90IGpzb24=', 'WyJ4Il0=', 'NQ=='):
+            with self.subTest(cursor=cursor):
+                response = self.anonymous.get(f'/api/recipes/?cursor={cursor}')
+                self.assertEqual(response.status_code, 404)
+
+
+class RecipeResponseCacheTest(APITestCase):
+
+    @override_settings(ALLOWED_HOSTS=['one.example.com', 'two.example.com'])
+    def test_cache_key_includes_host(self):
+        for host in ('one.example.com', 'two.example.com'):
+            with self.subTest(host=host):
+                response = self.anonymous.get(
+                    '/api/recipes/?limit=1', HTTP_HOST=host
+                )
+                self.assertEqual(response.status_code, 200)
+                image = response.data['results'][0]['image']
+                self.assertTrue(image.startswith(f'http://{host}/'))
+
+    def test_author_changes_invalidate_recipes(self):
+        user = self.users[0]
+        with self.captureOnCommitCallbacks() as callbacks:
+            user.save(update_fields=('last_login',))
+        self.assertEqual(callbacks, [])
+        with self.captureOnCommitCallbacks() as callbacks:
+            user.save()
+        self.assertEqual(callbacks, [])
+        with self.captureOnCommitCallbacks() as callbacks:
+            user.first_name = 'Другое имя'
+            user.save(update_fields=('first_name',))
+        self.assertEqual(len(callbacks), 1)
+
+    def test_registration_keeps_recipes_cache(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.anonymous.post('/api/users/', {
+                'email': 'new@example.com',
+                'username': 'new',
+                'first_name': 'Имя',
+                'last_name': 'Фамилия',
+                'password': 'Pa55word!x',
+            })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(callbacks, [])
+
+    def get_first(self, **headers):
+        return self.anonymous.get('/api/recipes/?limit=1', **headers)
+
+    @mock.patch('recipes.signals.schedule_renditions')
+    def test_recipe_changes_invalidate_cache(self, schedule_renditions):
+        etag = self.get_first()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=self.users[1],
+                name='Свежий рецепт',
+                image='recipes/images/image.png',
+                text='Описание',
+                cooking_time=5
+            )
+        response = self.get_first(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['name'], recipe.name)
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.name = 'Изменённый рецепт'
+            recipe.save()
+        response = self.get_first(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['name'], recipe.name)
+
+    def test_matching_etag_returns_not_modified(self):
+        response = self.get_first()
+        self.assertEqual(response.status_code, 200)
+        response = self.get_first(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.content)
+
+
+class TokenCacheTest(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.users[0])
+        self.token_client = APIClient()
+        self.token_client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+
+    def get_me(self):
+        return self.token_client.get('/api/users/me/')
+
+    def restore_entry(self, entry):
+        # Другой воркер продолжает хранить запись в своём кэше.
+        token_cache.set(self.token.key, entry)
+
+    def test_logout_revokes_cached_token(self):
+        self.assertEqual(self.get_me().status_code, 200)
+        entry = token_cache.get(self.token.key)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.token_client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.restore_entry(entry)
+        self.assertEqual(self.get_me().status_code, 401)
+
+    def test_deactivation_revokes_cached_token(self):
+        self.assertEqual(self.get_me().status_code, 200)
+        entry = token_cache.get(self.token.key)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.users[0].is_active = False
+            self.users[0].save()
+        self.restore_entry(entry)
+        self.assertEqual(self.get_me().status_code, 401)
+
+    def test_cached_token_needs_no_query(self):
+        self.assertEqual(self.get_me().status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_me().status_code, 200)
+
+
+class ProfilingTest(APITestCase):
+
+    def get_with_profile(self, user):
+        client = APIClient()
+        token = Token.objects.create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        with mock.patch('cProfile.Profile') as profile:
+            response = client.get('/api/recipes/?limit=1', HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        return profile
+
+    def test_profile_only_for_staff(self):
+        self.assertFalse(self.get_with_profile(self.users[1]).called)
+        self.users[2].is_staff = True
+        self.users[2].save()
+        self.assertTrue(self.get_with_profile(self.users[2]).called)
+
+    def test_invalid_token_is_not_profiled(self):
+        with mock.patch('cProfile.Profile') as profile:
+            self.anonymous.get(
+                '/api/recipes/',
+                HTTP_AUTHORIZATION='Token invalid',
+                HTTP_X_PROFILE='1'
+            )
+        self.assertFalse(profile.called)
+
+
+class MatchingIndexTest(APITestCase):
+
+    def test_index_follows_recipe_composition(self):
+        ingredient = Ingredient.objects.create(
+            name='Редкий ингредиент', measurement_unit='г'
+        )
+        url = f'/api/recipes/match/?ingredients={ingredient.id}'
+        self.assertEqual(self.anonymous.get(url).data['count'], 0)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Favorite.objects.create(
+                author=self.users[0], recipe=Recipe.objects.first()
+            )
+        self.assertNotIn(bump_matching_version, callbacks)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            IngredientRecipe.objects.create(
+                recipe=Recipe.objects.first(), ingredient=ingredient, amount=1
+            )
+        self.assertIn(bump_matching_version, callbacks)
+        self.assertEqual(self.anonymous.get(url).data['count'], 1)
+
+
+class MembershipCacheTest(APITestCase):
+
+    def get_flags(self, recipe):
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        return (
+            response.data['is_favorited'],
+            response.data['is_in_shopping_cart'],
+            response.data['author']['is_subscribed'],
+        )
+
+    def test_toggles_invalidate_membership(self):
+        recipe = Recipe.objects.filter(author=self.users[1]).first()
+        urls = (
+            f'/api/recipes/{recipe.id}/favorite/',
+            f'/api/recipes/{recipe.id}/shopping_cart/',
+            f'/api/users/{self.users[1].id}/subscribe/',
+        )
+        self.assertEqual(self.get_flags(recipe), (False, False, False))
+        for url in urls:
+            self.client.post(url)
+        self.assertEqual(self.get_flags(recipe), (True, True, True))
+        for url in urls:
+            self.client.delete(url)
+        self.assertEqual(self.get_flags(recipe), (False, False, False))
+
+    def test_membership_is_cached(self):
+        recipe = Recipe.objects.first()
+        self.get_flags(recipe)
+        with CaptureQueriesContext(connection) as queries:
+            self.get_flags(recipe)
+        tables = (
+            Favorite._meta.db_table,
+            ShoppingCart._meta.db_table,
+            Subscription._meta.db_table,
+        )
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries
+            if any(f'FROM "{table}"' in query['sql'] for table in tables)
+        ])
+
+
+class CountersTest(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = Recipe.objects.filter(author=self.users[1]).first()
+
+    def assertCounters(self, favorites, carts, followers):
+        self.recipe.refresh_from_db()
+        counter = UserCounter.objects.get(user=self.users[1])
+        self.assertEqual(
+            (
+                self.recipe.favorites_count,
+                self.recipe.shopping_carts_count,
+                counter.followers_count,
+            ),
+            (favorites, carts, followers)
+        )
+
+    def test_toggles_change_counters(self):
+        urls = (
+            f'/api/recipes/{self.recipe.id}/favorite/',
+            f'/api/recipes/{self.recipe.id}/shopping_cart/',
+            f'/api/users/{self.users[1].id}/subscribe/',
+        )
+        for url in urls:
+            self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertCounters(1, 1, 1)
+        for url in urls:
+            self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertCounters(1, 1, 1)
+        for url in urls:
+            self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertCounters(0, 0, 0)
+        for url in urls:
+            self.assertEqual(self.client.delete(url).status_code, 400)
+        self.assertCounters(0, 0, 0)
+
+    def test_recipes_count(self):
+        counter = UserCounter.objects.get(user=self.users[1])
+        self.assertEqual(counter.recipes_count, RECIPES_COUNT // 2)
+        self.recipe.delete()
+        counter.refresh_from_db()
+        self.assertEqual(counter.recipes_count, RECIPES_COUNT // 2 - 1)
+        response = self.anonymous.get(f'/api/users/{self.users[1].id}/')
+        self.assertEqual(response.status_code, 200)
+
+
+class ImportTest(APITestCase):
+
+    def import_rows(self, model, rows):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        with open(f'{directory}/rows.jsonl', 'w', encoding='utf-8') as file:
+            file.writelines(
+                json.dumps(row, ensure_ascii=False) + '\n' for row in rows
+            )
+        with mock.patch(
+            'recipes.management.commands.import_csv.PATH_TO_FILE',
+            f'{directory}/'
+        ):
+            call_command(
+                'import_csv',
+                'rows.jsonl',
+                name_model=model,
+                stdout=io.StringIO()
+            )
+
+    def test_users_get_own_password_hashes(self):
+        self.import_rows('User', [
+            {
+                'username': f'imported{i}',
+                'email': f'imported{i}@example.com',
+                'first_name': 'Имя',
+                'last_name': 'Фамилия',
+                'password': 'Pa55word!x',
+            }
+            for i in range(2)
+        ])
+        users = User.objects.filter(username__startswith='imported')
+        self.assertEqual(len({user.password for user in users}), 2)
+        for user in users:
+            self.assertTrue(user.check_password('Pa55word!x'))
+
+    def test_scores_refreshed_only_for_imported_recipes(self):
+        existing = Recipe.objects.first()
+        score = existing.score.popular
+        Recipe.objects.filter(pk=existing.pk).update(favorites_count=100)
+        self.import_rows('Recipe', [{
+            'author': self.users[2].username,
+            'name': 'Импортированный рецепт',
+            'text': 'Описание',
+            'cooking_time': 5,
+            'tags': [self.tags[0].slug],
+            'ingredients': [
+                [self.ingredients[0].name, 'г', 10],
+            ],
+        }])
+        imported = Recipe.objects.get(name='Импортированный рецепт')
+        self.assertTrue(RecipeScore.objects.filter(recipe=imported).exists())
+        existing.score.refresh_from_db()
+        self.assertEqual(existing.score.popular, score)
+
+
+class RelationQueriesTest(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = Recipe.objects.filter(author=self.users[1]).first()
+
+    def test_recipe_relations_queries(self):
+        for relation in ('favorite', 'shopping_cart'):
+            url = f'/api/recipes/{self.recipe.id}/{relation}/'
+            with self.subTest(relation=relation):
+                # Рецепт, вставка и счётчик внутри точки сохранения.
+                with self.assertNumQueries(5):
+                    response = self.client.post(url)
+                self.assertEqual(response.status_code, 201)
+                # Удаление одним запросом и счётчик.
+                with self.assertNumQueries(2):
+                    response = self.client.delete(url)
+                self.assertEqual(response.status_code, 204)
+
+    def test_subscription_queries(self):
+        url = f'/api/users/{self.users[2].id}/subscribe/'
+        cache.clear()
+        with self.assertNumQueries(7):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['is_subscribed'])
+        with self.assertNumQueries(3):
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, 204)
+        response = self.client.get(f'/api/users/{self.users[2].id}/')
+        self.assertFalse(response.data['is_subscribed'])
+
+    def test_user_deletion_updates_counters(self):
+        author = self.users[1]
+        Favorite.objects.create(author=self.users[2], recipe=self.recipe)
+        Subscription.objects.create(user=self.users[2], following=author)
+        self.users[2].delete()
+        self.recipe.refresh_from_db()
+        author.counter.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+        self.assertEqual(author.counter.followers_count, 0)
+
+
+class LoginTest(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['throttle'].clear()
+        Token.objects.create(user=self.users[0])
+
+    def login(self, password='Pa55word!x', address='10.0.0.1'):
+        return self.anonymous.post(
+            '/api/auth/token/login/',
+            {'email': self.users[0].email, 'password': password},
+            HTTP_X_FORWARDED_FOR=address
+        )
+
+    def test_login_is_single_query(self):
+        with self.assertNumQueries(1):
+            response = self.login()
+        self.assertEqual(response.status_code, 200)
+
+    def test_email_throttle(self):
+        throttle = LoginEmailThrottle()
+        attempts, _ = throttle.parse_rate(throttle.get_rate())
+        for attempt in range(attempts):
+            response = self.login('wrong', f'10.0.0.{attempt}')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.login(address='10.0.1.1').status_code, 429)
+
+    def exhaust_ip_throttle(self, address):
+        throttle = LoginIPThrottle()
+        attempts, _ = throttle.parse_rate(throttle.get_rate())
+        for attempt in range(attempts):
+            self.anonymous.post(
+                '/api/auth/token/login/',
+                {'email': f'user{attempt}@example.org', 'password': 'x'},
+                HTTP_X_FORWARDED_FOR=address
+            )
+
+    @override_settings(
+        REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}
+    )
+    def test_ip_throttle_uses_forwarded_address(self):
+        self.exhaust_ip_throttle('10.0.0.1')
+        self.assertEqual(self.login(address='10.0.0.1').status_code, 429)
+        self.assertEqual(self.login(address='10.0.0.2').status_code, 200)
+
+    def test_forwarded_address_ignored_without_proxy(self):
+        self.exhaust_ip_throttle('10.0.0.1')
+        self.assertEqual(self.login(address='10.0.0.2').status_code, 429)
+
+
+class FastRepresentationTest(APITestCase):
+    PATHS = (
+        '/api/recipes/?limit=20',
+        '/api/recipes/?limit=5&fields=id,name,tags,author&expand=author',
+        '/api/recipes/?fields=id,ingredients,is_favorited&expand=tags',
+        '/api/recipes/{recipe}/',
+        '/api/recipes/match/?ingredients={ingredients}',
+        '/api/users/',
+        '/api/users/?fields=id,username',
+        '/api/tags/',
+        '/api/ingredients/',
+    )
+    AUTHENTICATED_PATHS = (
+        '/api/users/me/',
+        '/api/users/subscriptions/?recipes_limit=2',
+        '/api/users/subscriptions/?expand=',
+    )
+
+    def setUp(self):
+        super().setUp()
+        Subscription.objects.create(
+            user=self.users[0], following=self.users[1]
+        )
+        Favorite.objects.create(
+            author=self.users[0], recipe=Recipe.objects.first()
+        )
+        Recipe.objects.filter(pk=Recipe.objects.first().pk).update(
+            name='Рецепт \u2028 с "кавычками" и </script>'
+        )
+
+    def get_paths(self, client):
+        if client is self.anonymous:
+            return self.PATHS
+        return self.PATHS + self.AUTHENTICATED_PATHS
+
+    def get_responses(self, client):
+        responses = []
+        for path in self.get_paths(client):
+            cache.clear()
+            response = client.get(path.format(
+                recipe=Recipe.objects.first().pk,
+                ingredients=','.join(
+                    str(ingredient.id) for ingredient in self.ingredients[:2]
+                )
+            ))
+            self.assertEqual(response.status_code, 200, path)
+            responses.append(response.content)
+        return responses
+
+    def test_same_output(self):
+        for client in (self.anonymous, self.client):
+            fast = self.get_responses(client)
+            with override_settings(FAST_REPRESENTATION=False), \
+                    mock.patch('api.renderers.orjson', None):
+                slow = self.get_responses(client)
+            for path, fast_content, slow_content in zip(
+                self.get_paths(client), fast, slow
+            ):
+                with self.subTest(
+                    path=path, authenticated=client is self.client
+                ):
+                    self.assertEqual(fast_content, slow_content)
+
+
+class FetchConcurrentlyTest(TransactionTestCase):
+    # Потоки пула работают со своими соединениями и не видят данные
+    # незавершённой транзакции, поэтому тест не оборачивается в неё.
+
+    def setUp(self):
+        cache.clear()
+        renditions = mock.patch('recipes.signals.schedule_renditions')
+        renditions.start()
+        self.addCleanup(renditions.stop)
+        self.user = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='Pa55word!x'
+        )
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {i}', color='#E26C2D', slug=f'tag{i}'
+            )
+            for i in range(2)
+        ]
+        ingredient = Ingredient.objects.create(
+            name='Ингредиент', measurement_unit='г'
+        )
+        for i in range(5):
+            recipe = Recipe.objects.create(
+                author=self.user,
+                name=f'Рецепт {i}',
+                image='recipes/images/image.png',
+                text='Описание',
+                cooking_time=10
+            )
+            recipe.tags.set(tags)
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=i + 1
+            )
+
+    def spy_threads(self):
+        threads = set()
+        run_query = concurrency.run_query
+
+        def spy(func):
+            threads.add(threading.get_ident())
+            return run_query(func)
+        return threads, mock.patch.object(concurrency, 'run_query', spy)
+
+    def test_all_lookups_are_prefetched(self):
+        threads, spy = self.spy_threads()
+        token = concurrency._concurrent.set(True)
+        try:
+            with spy:
+                recipes = concurrency.fetch_concurrently(
+                    Recipe.objects.prefetch_related('tags', 'recips')
+                )
+        finally:
+            concurrency._concurrent.reset(token)
+        self.assertNotIn(threading.get_ident(), threads)
+        self.assertEqual(len(recipes), 5)
+        with self.assertNumQueries(0):
+            for recipe in recipes:
+                self.assertEqual(len(recipe.tags.all()), 2)
+                self.assertEqual(len(recipe.recips.all()), 1)
+
+    @override_settings(ASYNC_VIEWS=True)
+    def test_async_view_runs_in_own_thread(self):
+        view = RecipeViewSet.as_view({'get': 'list'})
+        self.assertTrue(asyncio.iscoroutinefunction(view))
+        request = APIRequestFactory().get('/api/recipes/')
+        force_authenticate(request, self.user)
+        threads, spy = self.spy_threads()
+        with spy:
+            response = async_to_sync(view)(request)
+        self.assertGreater(len(threads), 1)
+        self.assertNotIn(threading.get_ident(), threads)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(response.data, client.get('/api/recipes/').data)
+
+
+class RecipeWriteQueriesTest(APITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media.enable()
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8), 'red').save(buffer, 'PNG')
+        cls.image = (
+            'data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode()
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def get_data(self, ingredients):
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 15,
+            'image': self.image,
+            'tags': [tag.id for tag in self.tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 5}
+                for ingredient in ingredients
+            ],
+        }
+
+    def count_queries(self, method, url, data):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = method(url, data, format='json')
+        self.assertIn(response.status_code, (200, 201))
+        self.assertEqual(
+            len(response.data['ingredients']), len(data['ingredients'])
+        )
+        return response, len(queries)
+
+    def test_create_and_update_queries(self):
+        counts = []
+        for size in (1, 3):
+            response, created = self.count_queries(
+                self.client.post,
+                '/api/recipes/',
+                self.get_data(self.ingredients[:size])
+            )
+            _, updated = self.count_queries(
+                self.client.patch,
+                f'/api/recipes/{response.data["id"]}/',
+                self.get_data(self.ingredients[size:size * 2])
+            )
+            counts.append((created, updated))
+        self.assertEqual(counts[0], counts[1])
+
+    @mock.patch('recipes.signals.schedule_renditions')
+    def test_same_image_stored_once(self, schedule_renditions):
+        images = [
+            self.client.post(
+                '/api/recipes/', self.get_data(self.ingredients[:1]),
+                format='json'
+            ).data['image']
+            for _ in range(2)
+        ]
+        self.assertEqual(images[0], images[1])
+        name = Recipe.objects.latest('id').image.name
+        digest = hashlib.sha256(
+            base64.b64decode(self.image.split(';base64,')[1])
+        ).hexdigest()
+        self.assertEqual(os.path.basename(name), f'{digest}.png')
+        directory = os.path.join(self.media_root, os.path.dirname(name))
+        self.assertEqual(os.listdir(directory), [f'{digest}.png'])
+
+    @mock.patch('recipes.signals.schedule_renditions')
+    def test_removed_ingredients_deleted_at_once(self, schedule_renditions):
+        response = self.client.post(
+            '/api/recipes/', self.get_data(self.ingredients), format='json'
+        )
+        recipe_id = response.data['id']
+        ShoppingCart.objects.create(author=self.users[1], recipe_id=recipe_id)
+        cart_key = SHOPPING_CART_CACHE_KEY.format(self.users[1].id)
+        cache.set(cart_key, 'список')
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(
+                    f'/api/recipes/{recipe_id}/',
+                    self.get_data(self.ingredients[:1]),
+                    format='json'
+                )
+        self.assertEqual(response.status_code, 200)
+        deletes = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('DELETE')
+            and IngredientRecipe._meta.db_table in query['sql']
+        ]
+        self.assertEqual(len(deletes), 1)
+        self.assertIsNone(cache.get(cart_key))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Нужен PostgreSQL')
+class SearchVectorTest(APITestCase):
+
+    def test_vectors_updated_in_one_query(self):
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        with self.assertNumQueries(1):
+            search.update_search_vectors(recipe_ids)
+        found = search.search_recipes(Recipe.objects.all(), 'Ингредиент')
+        self.assertEqual(found.count(), RECIPES_COUNT)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Нужен PostgreSQL')
+class RecipeIndexesTest(TransactionTestCase):
+    # Данных столько, чтобы планировщик сам выбирал индексы, а VACUUM
+    # нельзя выполнить внутри транзакции теста.
+    USERS = 50
+    RECIPES = 5000
+    CART_SIZE = 20
+
+    def setUp(self):
+        users = User.objects.bulk_create(
+            User(username=f'user{i}', email=f'user{i}@example.com')
+            for i in range(self.USERS)
+        )
+        self.tags = Tag.objects.bulk_create(
+            Tag(name=f'Тег {i}', color='#E26C2D', slug=f'tag{i}')
+            for i in range(10)
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(500)
+        )
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=users[i % self.USERS],
+                name=f'Рецепт {i}',
+                image='recipes/images/image.png',
+                text='Описание',
+                cooking_time=10
+            )
+            for i in range(self.RECIPES)
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=self.tags[(i + j) % 10])
+            for i, recipe in enumerate(recipes)
+            for j in range(2)
+        )
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
+                recipe=recipe,
+                ingredient=ingredients[(i * 7 + j) % 500],
+                amount=j + 1
+            )
+            for i, recipe in enumerate(recipes)
+            for j in range(5)
+        )
+        for model in (Favorite, ShoppingCart):
+            model.objects.bulk_create(
+                model(
+                    author=user,
+                    recipe=recipes[(i * 97 + j) % self.RECIPES]
+                )
+                for i, user in enumerate(users)
+                for j in range(self.CART_SIZE)
+            )
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM ANALYZE')
+        self.user = users[0]
+        self.recipe = recipes[0]
+
+    def assertUsesIndex(self, index, queryset):
+        self.assertIn(index, queryset.explain())
+
+    def test_feed_uses_index(self):
+        self.assertUsesIndex(
+            'recipe_pub_date_id_idx',
+            Recipe.objects.order_by('-pub_date', '-id')[:6]
+        )
+
+    def test_author_filter_uses_index(self):
+        self.assertUsesIndex(
+            'recipe_author_pub_date_idx',
+            Recipe.objects.filter(author=self.user).order_by('-pub_date')[:6]
+        )
+
+    def test_recipe_relations_use_index(self):
+        for model, index in (
+            (Favorite, 'favorite_recipe_author_idx'),
+            (ShoppingCart, 'cart_recipe_author_idx'),
+        ):
+            with self.subTest(model=model.__name__):
+                self.assertUsesIndex(index, model.objects.filter(
+                    recipe=self.recipe
+                ).values('author'))
+
+    def test_shopping_list_uses_index(self):
+        self.assertUsesIndex(
+            'ingredient_recipe_amount_idx',
+            IngredientRecipe.objects.filter(
+                recipe__shopping_carts__author=self.user
+            ).values_list(
+                'ingredient__name', 'ingredient__measurement_unit'
+            ).annotate(amount=Sum('amount'))
+        )
+
+    def test_tags_filter_uses_index(self):
+        self.assertUsesIndex(
+            'recipe_tags_tag_recipe_idx',
+            Recipe.objects.filter(tags__in=[self.tags[0].id]).distinct()
+        )
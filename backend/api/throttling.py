@@ -0,0 +1,30 @@
+from hashlib import md5
+
+from django.core.cache import caches
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class LoginThrottle(SimpleRateThrottle):
+    cache = caches['throttle']
+
+
+class LoginIPThrottle(LoginThrottle):
+    scope = 'login_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope, 'ident': self.get_ident(request)
+        }
+
+
+class LoginEmailThrottle(LoginThrottle):
+    scope = 'login_email'
+
+    def get_cache_key(self, request, view):
+        email = request.data.get('email')
+        if not isinstance(email, str) or not email:
+            return None
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': md5(email.strip().lower().encode()).hexdigest()
+        }
@@ -8,8 +8,8 @@ from api.views import (APIToken, DeleteApiToken, FavoriteRecipeView,
 
 router_v1 = routers.DefaultRouter()
 router_v1.register('recipes', RecipeViewSet)
-router_v1.register('tags', TagViewSet)
-router_v1.register('ingredients', IngredientViewSet)
+router_v1.register('tags', TagViewSet, basename='tag')
+router_v1.register('ingredients', IngredientViewSet, basename='ingredient')
 router_v1.register('users', UserViewSet)
 
 auth_urls = [
@@ -1,45 +1,100 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from hashlib import md5
+
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, Prefetch, Subquery
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, generics, status, viewsets
+from rest_framework import generics, status, viewsets
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import (IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
-from api.filters import RecipesFilter
-from api.loading_shopping_list import download_file
-from api.pagination import CustomPagination
+from api.cache import cache_anonymous_response
+from api.concurrency import AsyncViewMixin, run_concurrently
+from api.fieldsets import SparseFieldsetViewMixin
+from api.filters import IngredientSearchFilter, RecipesFilter
+from api.loading_shopping_list import FILE_FORMATS, download_file
+from api.pagination import CustomPagination, RecipePagination
 from api.permissions import AuthorOnlyPermission
 from api.serializers import (FavoriteSerializer, IngredientSerializer,
-                             RecipeSerializer, RecipeWriteSerializer,
-                             ShoppingCartSerializer, SubscriptionsSerializer,
-                             TagSerializer, TokenSerializer,
-                             UpdateUserPasswordSerializer, UserListSerializer,
-                             UserSerializer)
-from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Subscription, Tag, User)
-
-
-class UserViewSet(viewsets.ModelViewSet):
+                             RecipeMatchSerializer, RecipeSerializer,
+                             RecipeWriteSerializer, ShoppingCartSerializer,
+                             SubscriptionsSerializer, TagSerializer,
+                             TokenSerializer, UpdateUserPasswordSerializer,
+                             UserListSerializer, UserSerializer,
+                             get_recipes_limit)
+from api.throttling import LoginEmailThrottle, LoginIPThrottle
+from foodgram_backend.middleware import server_timing
+from recipes.catalogue import get_catalogue, get_version
+from recipes.matching import get_matching_index
+from recipes.membership import Membership
+from recipes.models import (Favorite, IngredientRecipe, Recipe, ShoppingCart,
+                            Subscription, User)
+from recipes.signals import update_deleted_relations
+
+USER_COLUMNS = ('email', 'username', 'first_name', 'last_name')
+RECIPE_COLUMNS = ('name', 'image', 'text', 'cooking_time')
+
+
+class MembershipMixin:
+    membership_fields = ()
+
+    def load_membership(self):
+        self.membership = Membership.for_user(self.request.user)
+
+    def get_concurrent_queries(self):
+        if self.request.user.is_anonymous or not any(
+            self.is_requested(name) for name in self.membership_fields
+        ):
+            return ()
+        return (self.load_membership,)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if hasattr(self, 'membership'):
+            context['membership'] = self.membership
+        return context
+
+
+class UserViewSet(
+    AsyncViewMixin,
+    MembershipMixin,
+    SparseFieldsetViewMixin,
+    viewsets.ModelViewSet
+):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     http_method_names = ['get', 'post', 'delete']
     pagination_class = CustomPagination
+    membership_fields = ('is_subscribed',)
+
+    def get_queryset(self):
+        fields, _ = self.get_fieldset()
+        if fields is None:
+            return User.objects.all()
+        return User.objects.only(
+            'id', *(column for column in USER_COLUMNS if column in fields)
+        )
 
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return UserSerializer
+        if self.action == 'subscriptions':
+            return SubscriptionsSerializer
         return UserListSerializer
 
     @action(detail=False, url_path='me', permission_classes=(IsAuthenticated,))
     def get_users_info(self, request):
-        user = User.objects.get(id=request.user.id)
-        serializer = UserListSerializer(user, context={'request': request})
+        serializer = self.get_serializer(request.user)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(
@@ -51,33 +106,68 @@ class UserViewSet(viewsets.ModelViewSet):
         user = request.user
         author = get_object_or_404(User, id=pk)
         if request.method == 'POST':
+            get_recipes_limit(request)
+            # После подписки автор заведомо в подписках пользователя,
+            # перечитывать их для is_subscribed не нужно.
             serializer = SubscriptionsSerializer(
-                author, context={'request': request}, data=request.data
+                author,
+                context={
+                    'request': request,
+                    'membership': Membership(following=(author.id,)),
+                },
+                data=request.data
             )
             serializer.is_valid(raise_exception=True)
-            Subscription.objects.create(user=user, following=author)
+            try:
+                with transaction.atomic():
+                    Subscription.objects.create(user=user, following=author)
+            except IntegrityError:
+                raise ValidationError({
+                    api_settings.NON_FIELD_ERRORS_KEY: [
+                        'Подписка на автора уже форомлена'
+                    ]
+                })
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         if request.method == 'DELETE':
-            subscription = Subscription.objects.filter(
+            deleted, _ = Subscription.objects.filter(
                 user=user, following=author
-            )
-            if not subscription:
+            ).delete()
+            if not deleted:
                 return Response(
                     {'errors': 'Подписка не была оформлена'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            subscription.delete()
+            update_deleted_relations(Subscription, [(user.id, author.id)])
             return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False, permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
-        user = request.user
-        subscriptions = User.objects.filter(following__user=user)
+        recipes_limit = get_recipes_limit(request)
+        subscriptions = self.get_queryset().filter(
+            following__user=request.user
+        ).order_by('id')
+        if self.is_requested('recipes_count'):
+            subscriptions = subscriptions.select_related('counter')
+        if self.is_requested('recipes'):
+            recipes = Recipe.objects.only(
+                'id', 'author',
+                *(('name', 'image', 'cooking_time')
+                  if self.is_expanded('recipes') else ())
+            )
+            if recipes_limit is not None:
+                recipes = recipes.filter(pk__in=Subquery(
+                    Recipe.objects.filter(
+                        author=OuterRef('author')
+                    ).values('pk')[:recipes_limit]
+                ))
+            subscriptions = subscriptions.prefetch_related(Prefetch(
+                'recipes', queryset=recipes, to_attr='limited_recipes'
+            ))
         pages = self.paginate_queryset(subscriptions)
-        serializer = SubscriptionsSerializer(
-            pages, many=True, context={'request': request}
-        )
-        return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(pages, many=True)
+        with server_timing('serializer'):
+            data = serializer.data
+        return self.get_paginated_response(data)
 
 
 class UpdateUserPassword(APIView):
@@ -91,19 +181,22 @@ class UpdateUserPassword(APIView):
 
         if serializer.is_valid():
             self.user.set_password(serializer.data.get('new_password'))
-            self.user.save()
+            self.user.save(update_fields=('password',))
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class APIToken(ObtainAuthToken):
+    throttle_classes = (LoginIPThrottle, LoginEmailThrottle)
 
     def post(self, request):
         serializer = TokenSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        email = serializer.validated_data.get('email')
-        user = get_object_or_404(User, email=email)
-        token, created = Token.objects.get_or_create(user=user)
+        user = serializer.validated_data['user']
+        try:
+            token, created = user.auth_token, False
+        except Token.DoesNotExist:
+            token, created = Token.objects.get_or_create(user=user)
         if created:
             return Response(
                 {'auth_token': str(token)}, status=status.HTTP_201_CREATED
@@ -114,120 +207,236 @@ class APIToken(ObtainAuthToken):
 
 
 class DeleteApiToken(APIView):
+    permission_classes = (IsAuthenticated,)
 
     def post(self, request):
-        Token.objects.get(user=request.user).delete()
+        request.auth.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    AsyncViewMixin,
+    MembershipMixin,
+    SparseFieldsetViewMixin,
+    viewsets.ModelViewSet
+):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     http_method_names = ['get', 'post', 'patch', 'delete']
     permission_classes = (IsAuthenticatedOrReadOnly, AuthorOnlyPermission)
-    pagination_class = CustomPagination
+    pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipesFilter
+    membership_fields = ('author', 'is_favorited', 'is_in_shopping_cart')
+
+    def get_queryset(self):
+        fields, _ = self.get_fieldset()
+        if fields is None:
+            queryset = Recipe.objects.defer('search_vector')
+        else:
+            columns = [
+                column for column in RECIPE_COLUMNS if column in fields
+            ]
+            if self.is_expanded('author'):
+                columns += ['author', *(
+                    f'author__{column}' for column in USER_COLUMNS
+                )]
+            elif self.is_requested('author'):
+                columns.append('author')
+            queryset = Recipe.objects.only('id', *columns)
+        if self.is_expanded('author'):
+            queryset = queryset.select_related('author')
+        if self.is_requested('tags'):
+            queryset = queryset.prefetch_related('tags')
+        if self.is_expanded('ingredients'):
+            queryset = queryset.prefetch_related(Prefetch(
+                'recips',
+                queryset=IngredientRecipe.objects.select_related('ingredient')
+            ))
+        elif self.is_requested('ingredients'):
+            queryset = queryset.prefetch_related(Prefetch(
+                'recips',
+                queryset=IngredientRecipe.objects.only(
+                    'recipe', 'ingredient', 'amount'
+                )
+            ))
+        return queryset
+
+    @cache_anonymous_response
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        with server_timing('serializer'):
+            data = serializer.data
+        return self.get_paginated_response(data)
+
+    @cache_anonymous_response
+    def retrieve(self, request, *args, **kwargs):
+        instance, *_ = run_concurrently(
+            self.get_object, *self.get_concurrent_queries()
+        )
+        serializer = self.get_serializer(instance)
+        with server_timing('serializer'):
+            data = serializer.data
+        return Response(data)
 
     def get_serializer_class(self):
+        if self.action == 'match':
+            return RecipeMatchSerializer
         if self.request.method == 'GET':
             return RecipeSerializer
         return RecipeWriteSerializer
 
+    @action(detail=False)
+    def match(self, request):
+        try:
+            ingredients = [
+                int(pk) for pk
+                in request.query_params.get('ingredients', '').split(',')
+                if pk
+            ]
+            cooking_time = request.query_params.get('cooking_time')
+            cooking_time = int(cooking_time) if cooking_time else None
+        except ValueError:
+            return Response(
+                {'errors': 'id ингредиентов и время приготовления '
+                           'должны быть целыми числами'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not ingredients:
+            return Response(
+                {'errors': 'Укажите id ингредиентов'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        tags = get_catalogue().tags_by_slug
+        slugs = request.query_params.getlist('tags')
+        if any(slug not in tags for slug in slugs):
+            return Response(
+                {'errors': 'Тег не найден'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        matches = get_matching_index().match(
+            ingredients, [tags[slug].id for slug in slugs], cooking_time
+        )
+        paginator = CustomPagination()
+        page = paginator.paginate_queryset(matches, request, view=self)
+        recipes = self.get_queryset().in_bulk(
+            [match.recipe_id for match in page]
+        )
+        page_recipes = []
+        for match in page:
+            recipe = recipes.get(match.recipe_id)
+            if recipe is not None:
+                recipe.match = match
+                page_recipes.append(recipe)
+        serializer = self.get_serializer(page_recipes, many=True)
+        with server_timing('serializer'):
+            data = serializer.data
+        return paginator.get_paginated_response(data)
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
 
+def get_catalogue_item(items, pk):
+    try:
+        return items[int(pk)]
+    except (KeyError, ValueError):
+        raise Http404
+
+
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Tag.objects.all()
     serializer_class = TagSerializer
     http_method_names = ['get']
     pagination_class = None
 
+    def get_queryset(self):
+        return get_catalogue().tags
+
+    def get_object(self):
+        return get_catalogue_item(
+            get_catalogue().tags_by_id, self.kwargs['pk']
+        )
+
+
+def ingredients_etag(request, *args, **kwargs):
+    request_hash = md5(
+        f'{request.get_full_path()}|{request.headers.get("Accept")}'.encode()
+    ).hexdigest()
+    return f'{get_version()}-{request_hash}'
+
 
+@method_decorator(condition(etag_func=ingredients_etag), name='dispatch')
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     http_method_names = ['get']
-    filter_backends = (filters.SearchFilter,)
-    search_fields = ('name',)
+    filter_backends = (IngredientSearchFilter,)
     pagination_class = None
 
+    def get_queryset(self):
+        return get_catalogue().ingredients
+
+    def get_object(self):
+        return get_catalogue_item(
+            get_catalogue().ingredients_by_id, self.kwargs['pk']
+        )
+
 
 class FavoriteShoppingCartView(
     generics.CreateAPIView, generics.DestroyAPIView
 ):
     serializer_class = ShoppingCartSerializer
     permission_classes = (IsAuthenticated,)
-
-    def get_recipe(self):
-        recipe_id = self.kwargs.get('recipe_id')
-        return get_object_or_404(Recipe, pk=recipe_id)
+    model = ShoppingCart
+    missing_error = 'Рецепт отсутствует в корзине'
 
     def perform_create(self, serializer):
-        serializer.save(
-            author=self.request.user,
-            recipe=self.get_recipe()
-        )
+        serializer.save(author=self.request.user)
 
-    def perform_destroy(self, instance):
-        instance.delete()
+    def destroy(self, request, *args, **kwargs):
+        recipe_id = self.kwargs.get('recipe_id')
+        deleted, _ = self.model.objects.filter(
+            author=request.user, recipe_id=recipe_id
+        ).delete()
+        if deleted:
+            update_deleted_relations(
+                self.model, [(request.user.id, recipe_id)]
+            )
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(Recipe, pk=recipe_id)
+        return Response(
+            {'errors': self.missing_error},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
 
 class FavoriteRecipeView(FavoriteShoppingCartView):
     serializer_class = FavoriteSerializer
-
-    def get_queryset(self):
-        return self.get_recipe().favorited.all()
-
-    def destroy(self, request, *args, **kwargs):
-        instance = Favorite.objects.filter(
-            author=self.request.user, recipe=self.get_recipe()
-        )
-        if not instance:
-            return Response(
-                {'errors': 'Рецепт отсутствует в избранном'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        self.perform_destroy(instance)
-        return Response(status=status.HTTP_204_NO_CONTENT)
+    model = Favorite
+    missing_error = 'Рецепт отсутствует в избранном'
 
 
 class ShoppingCartView(FavoriteShoppingCartView):
     serializer_class = ShoppingCartSerializer
 
-    def get_queryset(self):
-        return self.get_recipe().shopping_carts.all()
-
-    def destroy(self, request, *args, **kwargs):
-        instance = ShoppingCart.objects.filter(
-            author=self.request.user, recipe=self.get_recipe()
-        )
-        if not instance:
-            return Response(
-                {'errors': 'Рецепт отсутствует в корзине'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        self.perform_destroy(instance)
-        return Response(status=status.HTTP_204_NO_CONTENT)
-
 
 class ShoppingCartFile(APIView):
+    permission_classes = (IsAuthenticated,)
 
     def get(self, request):
-        response = HttpResponse(
-            content_type="text/csv",
-            charset='utf-8-sig',
+        file_format = request.query_params.get('file_type', 'txt')
+        if file_format not in FILE_FORMATS:
+            return Response(
+                {'errors': 'Неподдерживаемый формат файла, доступные '
+                           f'форматы: {", ".join(FILE_FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        content_type, filename = FILE_FORMATS[file_format]
+        return StreamingHttpResponse(
+            download_file(request.user, file_format),
+            content_type=f'{content_type}; charset=utf-8',
             headers={
-                "Content-Disposition": 'attachment; filename="recipe.txt"'
+                'Content-Disposition': f'attachment; filename="{filename}"'
             },
         )
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__shopping_carts__author=request.user.id
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(
-            amount=Sum('amount')
-        )
-        download_file(response, ingredients)
-        return response
@@ -0,0 +1,169 @@
+import cProfile
+import io
+import json
+import logging
+import pstats
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.db import connection
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from recipes.catalogue import versions_scope
+
+logger = logging.getLogger('foodgram.requests')
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_STATS_LIMIT = 30
+
+_metrics = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.timings = defaultdict(float)
+        self.size = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_time += perf_counter() - start
+
+
+@contextmanager
+def server_timing(name):
+    metrics = _metrics.get()
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.timings[name] += perf_counter() - start
+
+
+@contextmanager
+def track_queries():
+    metrics = _metrics.get()
+    if metrics is None:
+        yield
+        return
+    with connection.execute_wrapper(metrics):
+        yield
+
+
+class ServerTimingMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _metrics.set(metrics)
+        profiler = None
+        if self.can_profile(request):
+            profiler = cProfile.Profile()
+        start = perf_counter()
+        try:
+            with connection.execute_wrapper(metrics):
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            _metrics.reset(token)
+        metrics.timings['total'] = perf_counter() - start
+        if profiler is not None:
+            self.log_profile(request, profiler)
+        response['Server-Timing'] = self.server_timing_header(metrics)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                request, response, metrics, response.streaming_content
+            )
+        else:
+            metrics.size = len(response.content)
+            self.log_metrics(request, response, metrics)
+        return response
+
+    def can_profile(self, request):
+        # Пользователь определяется до запуска профилировщика, чтобы
+        # заголовок от остальных пользователей не замедлял запросы.
+        if PROFILE_HEADER not in request.headers:
+            return False
+        try:
+            user = Request(request, authenticators=[
+                authentication()
+                for authentication
+                in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+            ]).user
+        except APIException:
+            return False
+        return user.is_staff
+
+    def stream(self, request, response, metrics, content):
+        start = perf_counter()
+        with connection.execute_wrapper(metrics):
+            for chunk in content:
+                metrics.size += len(chunk)
+                yield chunk
+        metrics.timings['stream'] = perf_counter() - start
+        self.log_metrics(request, response, metrics)
+
+    def server_timing_header(self, metrics):
+        timings = [
+            f'sql;dur={metrics.sql_time * 1000:.1f};'
+            f'desc="{metrics.queries} queries"'
+        ]
+        timings.extend(
+            f'{name};dur={duration * 1000:.1f}'
+            for name, duration in metrics.timings.items()
+        )
+        return ', '.join(timings)
+
+    def log_metrics(self, request, response, metrics):
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': metrics.queries,
+            'sql_ms': round(metrics.sql_time * 1000, 1),
+            **{
+                f'{name}_ms': round(duration * 1000, 1)
+                for name, duration in metrics.timings.items()
+            },
+            'size': metrics.size,
+        }))
+
+    def log_profile(self, request, profiler):
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats(
+            'cumulative'
+        ).print_stats(PROFILE_STATS_LIMIT)
+        # Профиль запрошен явно, поэтому пишется и при уровне журнала
+        # по умолчанию.
+        logger.warning(
+            'Профиль %s %s\n%s', request.method, request.path,
+            stream.getvalue()
+        )
+
+
+class DataVersionsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with versions_scope():
+            return self.get_response(request)
@@ -1,7 +1,10 @@
 from django.contrib import admin
 
 from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Subscription, Tag)
+                            ShoppingCart, Subscription, Tag, UserCounter)
+from recipes.search import search_recipes
+from recipes.signals import (RELATION_FIELDS, update_deleted_relations,
+                             update_recipes_composition)
 
 
 class IngredientRecipInline(admin.StackedInline):
@@ -10,6 +13,20 @@ class IngredientRecipInline(admin.StackedInline):
     min_num = 1
 
 
+class RelationAdmin(admin.ModelAdmin):
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        update_deleted_relations(self.model, [
+            [getattr(obj, field) for field in RELATION_FIELDS[self.model]]
+        ])
+
+    def delete_queryset(self, request, queryset):
+        rows = list(queryset.values_list(*RELATION_FIELDS[self.model]))
+        super().delete_queryset(request, queryset)
+        update_deleted_relations(self.model, rows)
+
+
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name', 'measurement_unit')
@@ -27,11 +44,18 @@ class RecipAdmin(admin.ModelAdmin):
         'cooking_time',
         'author',
         'pub_date',
+        'favorites_count',
+        'shopping_carts_count',
     )
     list_filter = ('name', 'cooking_time', 'tags')
     search_fields = ('name',)
     filter_horizontal = ('tags',)
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return search_recipes(queryset, search_term), False
+
     @admin.display(description='Тег(-и)')
     def get_tags(self, obj):
         return ', '.join([tag.name for tag in obj.tags.all()])
@@ -57,17 +81,33 @@ class IngredientRecipAdmin(admin.ModelAdmin):
     list_filter = ('recipe', 'amount')
     search_fields = ('recipe', 'ingredient')
 
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        update_recipes_composition([obj.recipe_id])
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        update_recipes_composition(recipe_ids)
+
 
 @admin.register(Subscription)
-class SubscriptionAdmin(admin.ModelAdmin):
+class SubscriptionAdmin(RelationAdmin):
     search_fields = ('user',)
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(RelationAdmin):
     list_filter = ('recipe',)
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(RelationAdmin):
     list_filter = ('recipe',)
+
+
+@admin.register(UserCounter)
+class UserCounterAdmin(admin.ModelAdmin):
+    list_display = ('user', 'recipes_count', 'followers_count')
+    readonly_fields = ('recipes_count', 'followers_count')
+    search_fields = ('user__username',)
@@ -0,0 +1,155 @@
+from bisect import bisect_left
+from collections import namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models import F
+from django.utils import timezone
+
+from recipes.constants import (CATALOGUE_VERSION_KEY, MATCHING_VERSION_KEY,
+                               RECIPES_VERSION_KEY, TOKENS_VERSION_KEY)
+from recipes.models import Ingredient, Tag, Version
+
+TagRow = namedtuple('TagRow', ('id', 'name', 'color', 'slug'))
+IngredientRow = namedtuple('IngredientRow', ('id', 'name', 'measurement_unit'))
+
+
+_versions = ContextVar('data_versions', default=None)
+
+
+@contextmanager
+def versions_scope():
+    """Читает версии данных из базы не чаще одного раза за запрос."""
+    token = _versions.set([None])
+    try:
+        yield
+    finally:
+        _versions.reset(token)
+
+
+# Версии хранятся в базе, чтобы все процессы одновременно видели
+# изменения и пересобирали свои индексы в памяти.
+def load_versions():
+    return {
+        name: (value, modified)
+        for name, value, modified in Version.objects.values_list(
+            'name', 'value', 'modified'
+        )
+    }
+
+
+def load_version(name):
+    scope = _versions.get()
+    if scope is None:
+        versions = load_versions()
+    else:
+        if scope[0] is None:
+            scope[0] = load_versions()
+        versions = scope[0]
+    return versions.get(name, (1, None))
+
+
+def bump(name):
+    updated = Version.objects.filter(name=name).update(
+        value=F('value') + 1, modified=timezone.now()
+    )
+    if not updated:
+        Version.objects.get_or_create(name=name, defaults={'value': 2})
+    scope = _versions.get()
+    if scope is not None:
+        scope[0] = None
+
+
+def get_version():
+    return load_version(CATALOGUE_VERSION_KEY)[0]
+
+
+def bump_version():
+    bump(CATALOGUE_VERSION_KEY)
+
+
+def get_recipes_version():
+    return load_version(RECIPES_VERSION_KEY)[0]
+
+
+def bump_recipes_version():
+    bump(RECIPES_VERSION_KEY)
+
+
+def get_matching_version():
+    return load_version(MATCHING_VERSION_KEY)[0]
+
+
+def bump_matching_version():
+    bump(MATCHING_VERSION_KEY)
+
+
+def get_tokens_version():
+    return load_version(TOKENS_VERSION_KEY)[0]
+
+
+def bump_tokens_version():
+    bump(TOKENS_VERSION_KEY)
+
+
+class Catalogue:
+
+    def __init__(self, version, tags, ingredients):
+        self.version = version
+        self.tags = tags
+        self.tags_by_id = {tag.id: tag for tag in tags}
+        self.tags_by_slug = {tag.slug: tag for tag in tags}
+        self.ingredients = ingredients
+        self.ingredients_by_id = {
+            ingredient.id: ingredient for ingredient in ingredients
+        }
+        index = sorted(
+            (ingredient.name.lower(), ingredient.id, ingredient)
+            for ingredient in ingredients
+        )
+        self.ingredient_names = [name for name, _, _ in index]
+        self.ingredients_by_name = [ingredient for _, _, ingredient in index]
+
+    @classmethod
+    def load(cls, version):
+        return cls(
+            version,
+            tuple(TagRow._make(row) for row in Tag.objects.values_list(
+                *TagRow._fields
+            )),
+            tuple(
+                IngredientRow._make(row)
+                for row in Ingredient.objects.values_list(
+                    *IngredientRow._fields
+                )
+            )
+        )
+
+    def search_ingredients(self, query, limit):
+        names, ingredients = self.ingredient_names, self.ingredients_by_name
+        query = query.lower()
+        start = end = bisect_left(names, query)
+        while (
+            end < len(names) and end - start < limit
+            and names[end].startswith(query)
+        ):
+            end += 1
+        result = ingredients[start:end]
+        for name, ingredient in zip(names, ingredients):
+            if len(result) >= limit:
+                break
+            if query in name and not name.startswith(query):
+                result.append(ingredient)
+        return result
+
+
+_catalogue = None
+
+
+def get_catalogue():
+    global _catalogue
+    version = get_version()
+    catalogue = _catalogue
+    if catalogue is None or catalogue.version != version:
+        catalogue = _catalogue = Catalogue.load(version)
+    return catalogue
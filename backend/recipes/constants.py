@@ -7,3 +7,38 @@ MAX_LEN_FIRST_LAST_NAME = 150
 MAX_LEN_PASSWORD = 128
 
 PATH_TO_FILE = f'{settings.BASE_DIR}/data/'
+
+SHOPPING_CART_CACHE_KEY = 'shopping_cart_{}'
+SHOPPING_CART_CACHE_MAX_ROWS = 1000
+
+CATALOGUE_VERSION_KEY = 'catalogue_version'
+INGREDIENTS_SEARCH_LIMIT = 50
+
+IMPORT_BATCH_SIZE = 5000
+
+MEMBERSHIP_CACHE_KEY = 'membership_{}'
+
+MAX_PAGE_SIZE = 100
+
+MAX_IMAGE_SIZE = 5 * 1024 * 1024
+IMAGE_DECODE_CHUNK_SIZE = 64 * 1024
+IMAGE_RENDITIONS = {'small': (320, 320)}
+IMAGE_WORKERS = 2
+
+RECIPES_VERSION_KEY = 'recipes_version'
+MATCHING_VERSION_KEY = 'matching_version'
+TOKENS_VERSION_KEY = 'tokens_version'
+RECIPES_RESPONSE_CACHE_KEY = 'recipes_response_{}_{}'
+
+RECIPE_ORDERINGS = {
+    'pub_date': 'pub_date',
+    'popular': 'score__popular',
+    'trending': 'score__trending',
+}
+POPULAR_SCORE_PERIOD = 45000
+TRENDING_HALF_LIFE = 24 * 60 * 60
+
+SEARCH_CONFIG = 'russian'
+
+TOKEN_CACHE_SIZE = 1024
+TOKEN_CACHE_TTL = 60
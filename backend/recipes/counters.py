@@ -0,0 +1,54 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import (Favorite, Recipe, ShoppingCart, Subscription, User,
+                            UserCounter)
+
+
+def change_counter(queryset, field, delta):
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def change_recipe_counter(recipe_id, field, delta):
+    change_counter(Recipe.objects.filter(pk=recipe_id), field, delta)
+
+
+def change_user_counter(user_id, field, delta):
+    change_counter(UserCounter.objects.filter(user_id=user_id), field, delta)
+
+
+def count_subquery(model, field, outer_field='pk'):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                **{field: OuterRef(outer_field)}
+            ).order_by().values(field).annotate(
+                count=Count('pk')
+            ).values('count'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def recount_counters():
+    UserCounter.objects.bulk_create(
+        (
+            UserCounter(user_id=user_id)
+            for user_id in User.objects.filter(
+                counter__isnull=True
+            ).values_list('id', flat=True)
+        ),
+        ignore_conflicts=True
+    )
+    recipes = Recipe.objects.update(
+        favorites_count=count_subquery(Favorite, 'recipe'),
+        shopping_carts_count=count_subquery(ShoppingCart, 'recipe')
+    )
+    users = UserCounter.objects.update(
+        recipes_count=count_subquery(Recipe, 'author', 'user'),
+        followers_count=count_subquery(Subscription, 'following', 'user')
+    )
+    return recipes, users
@@ -0,0 +1,58 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.utils.deconstruct import deconstructible
+from PIL import Image
+
+from recipes.constants import IMAGE_RENDITIONS, IMAGE_WORKERS
+
+logger = logging.getLogger(__name__)
+executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS)
+
+
+@deconstructible
+class ContentHashStorage(FileSystemStorage):
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        digest = sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        directory, filename = os.path.split(name)
+        name = os.path.join(
+            directory,
+            digest.hexdigest() + os.path.splitext(filename)[1].lower()
+        )
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+
+def rendition_name(name, size):
+    return f'{os.path.splitext(name)[0]}_{size}.webp'
+
+
+def make_renditions(name):
+    try:
+        with default_storage.open(name) as file, Image.open(file) as image:
+            for size, dimensions in IMAGE_RENDITIONS.items():
+                rendition = rendition_name(name, size)
+                if default_storage.exists(rendition):
+                    continue
+                thumbnail = image.copy()
+                thumbnail.thumbnail(dimensions)
+                buffer = BytesIO()
+                thumbnail.save(buffer, 'WEBP')
+                default_storage.save(rendition, ContentFile(buffer.getvalue()))
+    except Exception:
+        logger.exception('Не удалось создать превью для %s', name)
+
+
+def schedule_renditions(name):
+    executor.submit(make_renditions, name)
@@ -0,0 +1,292 @@
+import base64
+import io
+import json
+import logging
+import math
+import subprocess
+import time
+import tracemalloc
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipes.management.commands.generate_data import PASSWORD
+from recipes.models import Ingredient, Recipe, Tag, User
+
+# Название, метод, адрес, тело запроса, нужна ли авторизация,
+# ключ состояния для id из ответа. Запросы на запись идут парами,
+# чтобы каждая итерация оставляла базу в исходном виде.
+ENDPOINTS = (
+    ('users-list', 'get', '/api/users/', None, False, None),
+    ('users-detail', 'get', '/api/users/{author}/', None, False, None),
+    ('users-create', 'post', '/api/users/', 'user', False, 'new_user'),
+    ('users-delete', 'delete', '/api/users/{new_user}/', None, False, None),
+    ('users-me', 'get', '/api/users/me/', None, True, None),
+    ('users-subscribe', 'post', '/api/users/{author}/subscribe/', None, True,
+     None),
+    ('users-subscriptions', 'get', '/api/users/subscriptions/?recipes_limit=3',
+     None, True, None),
+    ('users-unsubscribe', 'delete', '/api/users/{author}/subscribe/', None,
+     True, None),
+    ('users-set-password', 'post', '/api/users/set_password/', 'password',
+     True, None),
+    ('recipes-list', 'get', '/api/recipes/', None, False, None),
+    ('recipes-list-auth', 'get', '/api/recipes/?is_favorited=0', None, True,
+     None),
+    ('recipes-list-sparse', 'get',
+     '/api/recipes/?is_favorited=0&fields=id,name,image,cooking_time', None,
+     True, None),
+    ('recipes-detail', 'get', '/api/recipes/{recipe}/', None, False, None),
+    ('recipes-match', 'get', '/api/recipes/match/?ingredients={ingredient}',
+     None, False, None),
+    ('recipes-create', 'post', '/api/recipes/', 'recipe', True, 'new_recipe'),
+    ('recipes-update', 'patch', '/api/recipes/{new_recipe}/', 'recipe', True,
+     None),
+    ('recipes-favorite', 'post', '/api/recipes/{new_recipe}/favorite/', None,
+     True, None),
+    ('recipes-unfavorite', 'delete', '/api/recipes/{new_recipe}/favorite/',
+     None, True, None),
+    ('recipes-cart-add', 'post', '/api/recipes/{new_recipe}/shopping_cart/',
+     None, True, None),
+    ('recipes-download', 'get', '/api/recipes/download_shopping_cart/', None,
+     True, None),
+    ('recipes-cart-delete', 'delete',
+     '/api/recipes/{new_recipe}/shopping_cart/', None, True, None),
+    ('recipes-delete', 'delete', '/api/recipes/{new_recipe}/', None, True,
+     None),
+    ('tags-list', 'get', '/api/tags/', None, False, None),
+    ('tags-detail', 'get', '/api/tags/{tag}/', None, False, None),
+    ('ingredients-list', 'get', '/api/ingredients/', None, False, None),
+    ('ingredients-search', 'get', '/api/ingredients/?name={search}', None,
+     False, None),
+    ('ingredients-detail', 'get', '/api/ingredients/{ingredient}/', None,
+     False, None),
+    ('auth-logout', 'post', '/api/auth/token/logout/', None, True, None),
+    ('auth-login', 'post', '/api/auth/token/login/', 'login', False, 'token'),
+)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[max(math.ceil(percent / 100 * len(values)) - 1, 0)]
+
+
+def image_payload():
+    buffer = io.BytesIO()
+    Image.new('RGB', (1, 1)).save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер времени ответа, числа запросов к базе и памяти '
+        'для всех адресов API'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument(
+            '--warmup', type=int, default=2,
+            help='Итерации прогрева, не попадающие в результат'
+        )
+        parser.add_argument(
+            '--email', type=str, default=None,
+            help='Email пользователя, от имени которого идут запросы'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=1,
+            help='Зерно, с которым запускалась generate_data'
+        )
+        parser.add_argument('--output', type=str, default='benchmark.json')
+
+    def get_state(self, kwargs):
+        users = User.objects.filter(
+            email=kwargs['email']
+        ) if kwargs['email'] else User.objects.filter(
+            username__startswith=f'bench{kwargs["seed"]}_'
+        )
+        user = users.order_by('id').first()
+        recipe = Recipe.objects.exclude(author=user).exclude(
+            author__following__user=user
+        ).order_by('id').first()
+        ingredients = list(Ingredient.objects.order_by('id')[:3])
+        tags = list(Tag.objects.order_by('id').values_list('id', flat=True))
+        if user is None or recipe is None or not ingredients or not tags:
+            raise CommandError(
+                'Нет данных для замера, запустите generate_data'
+            )
+        return {
+            'user_email': user.email,
+            'author': recipe.author_id,
+            'recipe': recipe.id,
+            'tag': tags[0],
+            'ingredient': ingredients[0].id,
+            'search': ingredients[0].name[:3],
+            'payloads': {
+                'user': lambda i: {
+                    'email': f'benchmark_{i}@example.com',
+                    'username': f'benchmark_{i}',
+                    'first_name': 'Имя',
+                    'last_name': 'Фамилия',
+                    'password': PASSWORD,
+                },
+                'password': lambda i: {
+                    'current_password': PASSWORD,
+                    'new_password': PASSWORD,
+                },
+                'login': lambda i: {
+                    'email': user.email,
+                    'password': PASSWORD,
+                },
+                'recipe': lambda i: {
+                    'name': f'Замер {i}',
+                    'text': 'Рецепт для замера',
+                    'cooking_time': 10,
+                    'image': self.image,
+                    'tags': tags[:2],
+                    'ingredients': [
+                        {'id': ingredient.id, 'amount': 10}
+                        for ingredient in ingredients
+                    ],
+                },
+            },
+        }
+
+    def request(self, client, state, endpoint, iteration):
+        name, method, path, payload, auth, save_as = endpoint
+        client.credentials(**(
+            {'HTTP_AUTHORIZATION': f'Token {state["token"]}'} if auth else {}
+        ))
+        data = state['payloads'][payload](iteration) if payload else None
+        # Сбрасываем счётчики ограничения входа, иначе повторные
+        # логины замера получат 429.
+        caches['throttle'].clear()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = getattr(client, method)(
+                path.format(**state), data, format='json'
+            )
+            if response.streaming:
+                content = b''.join(response.streaming_content)
+            else:
+                content = response.content
+            elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            raise CommandError(
+                f'{name}: {response.status_code} {response.content[:200]}'
+            )
+        if save_as == 'token':
+            state['token'] = response.data['auth_token']
+        elif save_as:
+            state[save_as] = response.data['id']
+        return elapsed, len(queries), len(content), response.status_code
+
+    def run(self, client, state, iterations, warmup):
+        results = {
+            endpoint[0]: {
+                'latency': [], 'queries': [], 'bytes': [], 'memory': []
+            }
+            for endpoint in ENDPOINTS
+        }
+        for iteration in range(warmup + iterations):
+            for endpoint in ENDPOINTS:
+                elapsed, queries, size, status = self.request(
+                    client, state, endpoint, iteration
+                )
+                if iteration >= warmup:
+                    result = results[endpoint[0]]
+                    result['latency'].append(elapsed)
+                    result['queries'].append(queries)
+                    result['bytes'].append(size)
+                    result['status'] = status
+        tracemalloc.start()
+        try:
+            for endpoint in ENDPOINTS:
+                current = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                self.request(
+                    client, state, endpoint, warmup + iterations
+                )
+                results[endpoint[0]]['memory'] = (
+                    tracemalloc.get_traced_memory()[1] - current
+                )
+        finally:
+            tracemalloc.stop()
+        return {
+            name: {
+                'status': result['status'],
+                'p50_ms': round(percentile(result['latency'], 50) * 1000, 2),
+                'p99_ms': round(percentile(result['latency'], 99) * 1000, 2),
+                'mean_ms': round(
+                    sum(result['latency']) / len(result['latency']) * 1000, 2
+                ),
+                'queries': max(result['queries']),
+                'bytes': max(result['bytes']),
+                'peak_memory_kb': round(result['memory'] / 1024, 1),
+            }
+            for name, result in results.items()
+        }
+
+    def handle(self, *args, **kwargs):
+        if kwargs['iterations'] < 1:
+            raise CommandError('Нужна хотя бы одна итерация')
+        self.image = image_payload()
+        client = APIClient()
+        request_logger = logging.getLogger('foodgram.requests')
+        request_logger.disabled = True
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']), \
+                    transaction.atomic():
+                state = self.get_state(kwargs)
+                response = client.post(
+                    '/api/auth/token/login/',
+                    {'email': state['user_email'], 'password': PASSWORD},
+                    format='json'
+                )
+                if 'auth_token' not in response.data:
+                    raise CommandError(
+                        f'Не удалось войти как {state["user_email"]}'
+                    )
+                state['token'] = response.data['auth_token']
+                endpoints = self.run(
+                    client, state, kwargs['iterations'], kwargs['warmup']
+                )
+                transaction.set_rollback(True)
+        finally:
+            request_logger.disabled = False
+        report = {
+            'revision': git_revision(),
+            'database': connection.vendor,
+            'iterations': kwargs['iterations'],
+            'endpoints': endpoints,
+        }
+        with open(kwargs['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        for name, result in endpoints.items():
+            self.stdout.write(
+                f'{name:<22} p50 {result["p50_ms"]:>8} мс  '
+                f'p99 {result["p99_ms"]:>8} мс  '
+                f'запросов {result["queries"]:>3}  '
+                f'ответ {result["bytes"]:>7} Б  '
+                f'память {result["peak_memory_kb"]:>8} КБ'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты сохранены в {kwargs["output"]}'
+        ))
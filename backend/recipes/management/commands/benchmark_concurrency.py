@@ -0,0 +1,155 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.management.commands.benchmark_api import git_revision, percentile
+from recipes.management.commands.generate_data import PASSWORD
+from recipes.models import Ingredient, Recipe, User
+
+# Эндпоинты чтения, запросы которых выполняются параллельно
+# при запуске через ASGI.
+ENDPOINTS = (
+    ('recipes-list', '/api/recipes/'),
+    ('recipes-detail', '/api/recipes/{recipe}/'),
+    ('ingredients-search', '/api/ingredients/?name={search}'),
+    ('users-subscriptions', '/api/users/subscriptions/?recipes_limit=3'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер пропускной способности эндпоинтов чтения при одновременных '
+        'клиентах для запущенного сервера (WSGI или ASGI)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', type=str, default='http://127.0.0.1:8000',
+            help='Адрес запущенного сервера'
+        )
+        parser.add_argument(
+            '--clients', type=int, default=16,
+            help='Число одновременных клиентов'
+        )
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='Длительность замера каждого эндпоинта в секундах'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=1,
+            help='Зерно, с которым запускалась generate_data'
+        )
+        parser.add_argument(
+            '--label', type=str, default='',
+            help='Метка прогона в отчёте, например asgi или wsgi'
+        )
+        parser.add_argument(
+            '--output', type=str, default='benchmark_concurrency.json'
+        )
+
+    def get_state(self, seed):
+        user = User.objects.filter(
+            username__startswith=f'bench{seed}_', following__isnull=False
+        ).order_by('id').first()
+        recipe = Recipe.objects.order_by('id').first()
+        ingredient = Ingredient.objects.order_by('id').first()
+        if user is None or recipe is None or ingredient is None:
+            raise CommandError(
+                'Нет данных для замера, запустите generate_data'
+            )
+        return {
+            'email': user.email,
+            'recipe': recipe.id,
+            'search': quote(ingredient.name[:3]),
+        }
+
+    def fetch(self, url, token=None, data=None):
+        request = Request(url, data=data)
+        if data is not None:
+            request.add_header('Content-Type', 'application/json')
+        if token is not None:
+            request.add_header('Authorization', f'Token {token}')
+        start = time.perf_counter()
+        try:
+            with urlopen(request) as response:
+                body = response.read()
+                status = response.status
+        except HTTPError as error:
+            body = error.read()
+            status = error.code
+        return time.perf_counter() - start, status, body
+
+    def login(self, base_url, email):
+        _, status, body = self.fetch(
+            f'{base_url}/api/auth/token/login/',
+            data=json.dumps({'email': email, 'password': PASSWORD}).encode()
+        )
+        if status not in (200, 201):
+            raise CommandError(f'Не удалось войти как {email}: {status}')
+        return json.loads(body)['auth_token']
+
+    def client(self, url, token, deadline):
+        latency, errors = [], 0
+        while time.perf_counter() < deadline:
+            elapsed, status, _ = self.fetch(url, token)
+            if status >= 400:
+                errors += 1
+            latency.append(elapsed)
+        return latency, errors
+
+    def run(self, url, token, clients, duration):
+        deadline = time.perf_counter() + duration
+        start = time.perf_counter()
+        with ThreadPoolExecutor(clients) as executor:
+            results = list(executor.map(
+                lambda _: self.client(url, token, deadline), range(clients)
+            ))
+        elapsed = time.perf_counter() - start
+        latency = [value for values, _ in results for value in values]
+        return {
+            'requests': len(latency),
+            'errors': sum(errors for _, errors in results),
+            'rps': round(len(latency) / elapsed, 1),
+            'p50_ms': round(percentile(latency, 50) * 1000, 2),
+            'p99_ms': round(percentile(latency, 99) * 1000, 2),
+        }
+
+    def handle(self, *args, **kwargs):
+        if kwargs['clients'] < 1 or kwargs['duration'] <= 0:
+            raise CommandError('Нужен хотя бы один клиент и время замера')
+        base_url = kwargs['url'].rstrip('/')
+        state = self.get_state(kwargs['seed'])
+        token = self.login(base_url, state['email'])
+        endpoints = {}
+        for name, path in ENDPOINTS:
+            endpoints[name] = self.run(
+                base_url + path.format(**state),
+                token,
+                kwargs['clients'],
+                kwargs['duration']
+            )
+            result = endpoints[name]
+            self.stdout.write(
+                f'{name:<20} {result["rps"]:>8} запр/с  '
+                f'p50 {result["p50_ms"]:>8} мс  '
+                f'p99 {result["p99_ms"]:>8} мс  '
+                f'ошибок {result["errors"]}'
+            )
+        report = {
+            'revision': git_revision(),
+            'label': kwargs['label'],
+            'url': base_url,
+            'clients': kwargs['clients'],
+            'duration': kwargs['duration'],
+            'endpoints': endpoints,
+        }
+        with open(kwargs['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты сохранены в {kwargs["output"]}'
+        ))
@@ -0,0 +1,166 @@
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.catalogue import (bump_matching_version, bump_recipes_version,
+                               bump_version)
+from recipes.constants import IMPORT_BATCH_SIZE
+from recipes.counters import recount_counters
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Subscription, Tag, User)
+from recipes.scores import refresh_scores
+from recipes.search import rebuild_search_vectors
+
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+PASSWORD = 'benchmark-password'
+MAX_RECIPE_INGREDIENTS = 10
+
+
+def random_pairs(rng, left, right, count, exclude_same=False):
+    count = min(count, len(left) * len(right) - (
+        len(left) if exclude_same else 0
+    ))
+    pairs = set()
+    while len(pairs) < count:
+        pair = (rng.choice(left), rng.choice(right))
+        if not exclude_same or pair[0] != pair[1]:
+            pairs.add(pair)
+    return sorted(pairs)
+
+
+class Command(BaseCommand):
+    help = 'Генерация воспроизводимых тестовых данных для нагрузки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--favorites', type=int, default=5000)
+        parser.add_argument('--carts', type=int, default=2000)
+        parser.add_argument('--subscriptions', type=int, default=1000)
+        parser.add_argument(
+            '--seed', type=int, default=1, help='Зерно генератора'
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **kwargs):
+        rng = random.Random(kwargs['seed'])
+        prefix = f'bench{kwargs["seed"]}'
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(
+                f'Данные с зерном {kwargs["seed"]} уже сгенерированы'
+            )
+        start = time.perf_counter()
+        for name, color, slug in TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color}
+            )
+        tags = list(Tag.objects.values_list('id', flat=True))
+        Ingredient.objects.bulk_create(
+            (
+                Ingredient(
+                    name=f'{prefix} ингредиент {i}', measurement_unit='г'
+                )
+                for i in range(kwargs['ingredients'])
+            ),
+            batch_size=IMPORT_BATCH_SIZE
+        )
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'{prefix}_{i}',
+                    email=f'{prefix}_{i}@example.com',
+                    first_name=f'Имя {i}',
+                    last_name=f'Фамилия {i}',
+                    password=password
+                )
+                for i in range(kwargs['users'])
+            ),
+            batch_size=IMPORT_BATCH_SIZE
+        )
+        users = list(User.objects.filter(
+            username__startswith=f'{prefix}_'
+        ).order_by('id').values_list('id', flat=True))
+        if not users or not ingredients:
+            raise CommandError('Нужен хотя бы один пользователь и ингредиент')
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author_id=rng.choice(users),
+                    name=f'Рецепт {i}',
+                    text=f'Описание рецепта {i}',
+                    cooking_time=rng.randint(1, 180),
+                    image=''
+                )
+                for i in range(kwargs['recipes'])
+            ),
+            batch_size=IMPORT_BATCH_SIZE
+        )
+        recipes = list(Recipe.objects.filter(
+            author__in=users
+        ).order_by('id').values_list('id', flat=True))
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+                for recipe in recipes
+                for tag in rng.sample(tags, rng.randint(1, len(tags)))
+            ),
+            batch_size=IMPORT_BATCH_SIZE
+        )
+        IngredientRecipe.objects.bulk_create(
+            (
+                IngredientRecipe(
+                    recipe_id=recipe,
+                    ingredient_id=ingredient,
+                    amount=rng.randint(1, 500)
+                )
+                for recipe in recipes
+                for ingredient in rng.sample(ingredients, rng.randint(
+                    1, min(MAX_RECIPE_INGREDIENTS, len(ingredients))
+                ))
+            ),
+            batch_size=IMPORT_BATCH_SIZE
+        )
+        if recipes:
+            for model, count in (
+                (Favorite, kwargs['favorites']),
+                (ShoppingCart, kwargs['carts'])
+            ):
+                model.objects.bulk_create(
+                    (
+                        model(author_id=user, recipe_id=recipe)
+                        for user, recipe in random_pairs(
+                            rng, users, recipes, count
+                        )
+                    ),
+                    batch_size=IMPORT_BATCH_SIZE
+                )
+        Subscription.objects.bulk_create(
+            (
+                Subscription(user_id=user, following_id=author)
+                for user, author in random_pairs(
+                    rng, users, users, kwargs['subscriptions'],
+                    exclude_same=True
+                )
+            ),
+            batch_size=IMPORT_BATCH_SIZE
+        )
+        recount_counters()
+        refresh_scores()
+        rebuild_search_vectors()
+        transaction.on_commit(bump_version)
+        transaction.on_commit(bump_recipes_version)
+        transaction.on_commit(bump_matching_version)
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные сгенерированы за {time.perf_counter() - start:.2f} с. '
+            f'Пароль пользователей {prefix}_*: {PASSWORD}'
+        ))
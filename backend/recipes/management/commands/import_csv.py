@@ -1,37 +1,296 @@
 import csv
+import json
+import time
+from itertools import islice
 
-from django.core.management.base import BaseCommand
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
-from recipes.constants import PATH_TO_FILE
-from recipes.models import Ingredient
+from recipes.catalogue import (bump_matching_version, bump_recipes_version,
+                               bump_version)
+from recipes.constants import IMPORT_BATCH_SIZE, PATH_TO_FILE
+from recipes.counters import recount_counters
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag, User
+from recipes.scores import refresh_scores
+from recipes.search import rebuild_search_vectors
 
-MODELS = {
-    'Ingredient': Ingredient
+FIELDS = {
+    'Ingredient': ('name', 'measurement_unit'),
+    'Tag': ('name', 'color', 'slug'),
+    'User': ('username', 'email', 'first_name', 'last_name', 'password'),
+}
+
+
+def batches(rows, batch_size):
+    rows = iter(rows)
+    batch = list(islice(rows, batch_size))
+    while batch:
+        yield batch
+        batch = list(islice(rows, batch_size))
+
+
+class CsvStream:
+
+    def __init__(self, rows, fields):
+        writer = csv.writer(self)
+        self.lines = (
+            writer.writerow([row[field] for field in fields]) for row in rows
+        )
+        self.buffer = ''
+
+    def write(self, value):
+        return value
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.buffer += line
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def copy_ingredients(rows):
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMP TABLE import_ingredient '
+            '(name varchar(200), measurement_unit varchar(200)) '
+            'ON COMMIT DROP'
+        )
+        cursor.copy_expert(
+            'COPY import_ingredient FROM STDIN WITH (FORMAT csv)',
+            CsvStream(rows, FIELDS['Ingredient'])
+        )
+        cursor.execute(
+            'INSERT INTO recipes_ingredient (name, measurement_unit) '
+            'SELECT DISTINCT name, measurement_unit FROM import_ingredient i '
+            'WHERE NOT EXISTS (SELECT 1 FROM recipes_ingredient r '
+            'WHERE r.name = i.name '
+            'AND r.measurement_unit = i.measurement_unit)'
+        )
+        return cursor.rowcount
+
+
+def load_ingredients(rows, batch_size, use_copy):
+    if use_copy:
+        return copy_ingredients(rows)
+    existing = set(Ingredient.objects.values_list('name', 'measurement_unit'))
+    created = 0
+    for batch in batches(rows, batch_size):
+        ingredients = []
+        for row in batch:
+            key = (row['name'], row['measurement_unit'])
+            if key not in existing:
+                existing.add(key)
+                ingredients.append(Ingredient(**row))
+        Ingredient.objects.bulk_create(ingredients)
+        created += len(ingredients)
+    return created
+
+
+def load_tags(rows, batch_size, use_copy):
+    existing = Tag.objects.in_bulk(field_name='slug')
+    created = 0
+    for batch in batches(rows, batch_size):
+        tags, updated = {}, []
+        for row in batch:
+            tag = existing.get(row['slug'])
+            if tag is None:
+                tags[row['slug']] = Tag(**row)
+            elif (tag.name, tag.color) != (row['name'], row['color']):
+                tag.name, tag.color = row['name'], row['color']
+                updated.append(tag)
+        Tag.objects.bulk_create(tags.values())
+        Tag.objects.bulk_update(updated, ('name', 'color'))
+        existing.update(tags)
+        created += len(tags)
+    return created
+
+
+def load_users(rows, batch_size, use_copy):
+    existing = set()
+    for username, email in User.objects.values_list('username', 'email'):
+        existing.update((username, email))
+    created = 0
+    for batch in batches(rows, batch_size):
+        users = []
+        for row in batch:
+            if row['username'] in existing or row['email'] in existing:
+                continue
+            existing.update((row['username'], row['email']))
+            users.append(User(
+                **{**row, 'password': make_password(row.get('password'))}
+            ))
+        User.objects.bulk_create(users)
+        created += len(users)
+    return created
+
+
+def load_recipes(rows, batch_size, use_copy):
+    tags = Tag.objects.in_bulk(field_name='slug')
+    created = 0
+    for batch in batches(rows, batch_size):
+        authors = User.objects.in_bulk(
+            {row['author'] for row in batch}, field_name='username'
+        )
+        ingredients = {
+            (name, measurement_unit): id
+            for id, name, measurement_unit in Ingredient.objects.filter(
+                name__in={
+                    name for row in batch
+                    for name, _, _ in row['ingredients']
+                }
+            ).values_list('id', 'name', 'measurement_unit')
+        }
+        existing = set(Recipe.objects.filter(
+            author__in=authors.values(),
+            name__in={row['name'] for row in batch}
+        ).values_list('author_id', 'name'))
+        recipes = {}
+        for row in batch:
+            author = authors.get(row['author'])
+            if author is None:
+                raise CommandError(f'Автор {row["author"]} не найден')
+            key = (author.id, row['name'])
+            if key in existing or key in recipes:
+                continue
+            for slug in row['tags']:
+                if slug not in tags:
+                    raise CommandError(f'Тег {slug} не найден')
+            for name, measurement_unit, _ in row['ingredients']:
+                if (name, measurement_unit) not in ingredients:
+                    raise CommandError(
+                        f'Ингредиент {name} ({measurement_unit}) не найден'
+                    )
+            recipes[key] = (Recipe(
+                author=author,
+                name=row['name'],
+                text=row['text'],
+                cooking_time=row['cooking_time'],
+                image=row.get('image', '')
+            ), row)
+        with transaction.atomic():
+            Recipe.objects.bulk_create(
+                recipe for recipe, _ in recipes.values()
+            )
+            ids = {
+                (author_id, name): id
+                for id, author_id, name in Recipe.objects.filter(
+                    author__in=authors.values(),
+                    name__in={name for _, name in recipes}
+                ).values_list('id', 'author_id', 'name')
+            }
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe_id=ids[key], tag_id=tags[slug].id)
+                for key, (_, row) in recipes.items()
+                for slug in row['tags']
+            )
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe_id=ids[key],
+                    ingredient_id=ingredients[name, measurement_unit],
+                    amount=amount
+                )
+                for key, (_, row) in recipes.items()
+                for name, measurement_unit, amount in row['ingredients']
+            )
+        created += len(recipes)
+    return created
+
+
+LOADERS = {
+    'Ingredient': load_ingredients,
+    'Tag': load_tags,
+    'User': load_users,
+    'Recipe': load_recipes,
 }
 
 
 class Command(BaseCommand):
-    help = 'Команда импорта .csv файлов'
+    help = 'Команда импорта .csv и .jsonl файлов'
 
     def add_arguments(self, parser):
-        parser.add_argument('name_file', type=str, help='Название файла csv')
+        parser.add_argument(
+            'name_file', type=str, help='Название файла csv или jsonl'
+        )
         parser.add_argument(
             '--name_model',
             type=str,
-            help='Название модели для добавления из файла csv'
+            default='Ingredient',
+            help='Название модели для добавления из файла'
+        )
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=IMPORT_BATCH_SIZE,
+            help='Количество строк, сохраняемых за один запрос'
+        )
+        parser.add_argument(
+            '--no_copy',
+            action='store_true',
+            help='Не использовать COPY в PostgreSQL'
         )
 
+    def read_rows(self, file, name_file, name_model):
+        if name_file.endswith('.jsonl'):
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        if name_model not in FIELDS:
+            raise CommandError(
+                f'Модель {name_model} загружается только из файла jsonl'
+            )
+        for row in csv.reader(file):
+            yield dict(zip(FIELDS[name_model], row))
+
+    def count_rows(self, rows):
+        for row in rows:
+            self.processed += 1
+            yield row
+
     def handle(self, *args, **kwargs):
         name_file = kwargs['name_file']
-        name_model = kwargs['name_model']
-        name_model = name_model.title()
-        model = MODELS[name_model]
+        name_model = kwargs['name_model'].title()
+        if name_model not in LOADERS:
+            raise CommandError(f'Модель {name_model} не поддерживается')
+        use_copy = (
+            name_model == 'Ingredient' and not kwargs['no_copy']
+            and connection.vendor == 'postgresql'
+        )
+        self.processed = 0
+        start = time.perf_counter()
         with open(
             f'{PATH_TO_FILE}{name_file}', 'r', encoding='utf-8'
-        ) as csvfile:
-            reader = csv.reader(csvfile)
-            for name, unit in reader:
-                model.objects.create(name=name, measurement_unit=unit)
-            self.stdout.write(
-                self.style.SUCCESS('Данные из файла загружены')
+        ) as file:
+            created = LOADERS[name_model](
+                self.count_rows(self.read_rows(file, name_file, name_model)),
+                kwargs['batch_size'],
+                use_copy
             )
+        elapsed = time.perf_counter() - start
+        if name_model in ('Ingredient', 'Tag'):
+            bump_version()
+        if name_model in ('User', 'Recipe') and created:
+            recount_counters()
+        if name_model == 'Recipe' and created:
+            # bulk_create не создаёт оценки через сигнал, поэтому рецепты
+            # без оценки и есть только что загруженные.
+            recipe_ids = list(Recipe.objects.filter(
+                score__isnull=True
+            ).values_list('id', flat=True))
+            refresh_scores(kwargs['batch_size'], recipe_ids)
+            rebuild_search_vectors(kwargs['batch_size'], recipe_ids)
+        if name_model in ('Ingredient', 'Tag', 'Recipe'):
+            bump_recipes_version()
+        if name_model == 'Recipe':
+            bump_matching_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные из файла загружены: обработано {self.processed}, '
+            f'добавлено {created} за {elapsed:.2f} с '
+            f'({self.processed / elapsed:.0f} строк/с)'
+        ))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from recipes.constants import IMPORT_BATCH_SIZE
+from recipes.search import rebuild_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Пересборка поискового индекса рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=IMPORT_BATCH_SIZE,
+            help='Количество рецептов, обрабатываемых за один проход'
+        )
+
+    def handle(self, *args, **kwargs):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(
+                'Поиск без PostgreSQL строит индекс в памяти, '
+                'пересборка не требуется'
+            )
+            return
+        start = time.perf_counter()
+        rebuilt = rebuild_search_vectors(kwargs['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковый индекс пересобран: {rebuilt} рецептов '
+            f'за {time.perf_counter() - start:.2f} с'
+        ))
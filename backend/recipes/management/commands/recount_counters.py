@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import recount_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт счётчиков рецептов и пользователей'
+
+    @transaction.atomic
+    def handle(self, *args, **kwargs):
+        start = time.perf_counter()
+        recipes, users = recount_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики пересчитаны: рецептов {recipes}, '
+            f'пользователей {users} за {time.perf_counter() - start:.2f} с'
+        ))
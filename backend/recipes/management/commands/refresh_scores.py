@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.catalogue import bump_recipes_version
+from recipes.constants import IMPORT_BATCH_SIZE
+from recipes.scores import refresh_scores
+
+
+class Command(BaseCommand):
+    help = 'Обновление рейтингов популярности рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=IMPORT_BATCH_SIZE,
+            help='Количество рейтингов, сохраняемых за один запрос'
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **kwargs):
+        start = time.perf_counter()
+        refreshed = refresh_scores(kwargs['batch_size'])
+        if refreshed:
+            transaction.on_commit(bump_recipes_version)
+        self.stdout.write(self.style.SUCCESS(
+            f'Рейтинги обновлены: {refreshed} рецептов '
+            f'за {time.perf_counter() - start:.2f} с'
+        ))
@@ -0,0 +1,75 @@
+from array import array
+from collections import defaultdict, namedtuple
+
+from recipes.catalogue import get_matching_version
+from recipes.models import IngredientRecipe, Recipe
+
+Match = namedtuple('Match', ('recipe_id', 'matched', 'total'))
+
+
+class MatchingIndex:
+
+    def __init__(self, version, recipes, ingredients, tags):
+        self.version = version
+        self.cooking_time = dict(recipes)
+        self.sizes = defaultdict(int)
+        postings = defaultdict(list)
+        for recipe_id, ingredient_id in ingredients:
+            postings[ingredient_id].append(recipe_id)
+            self.sizes[recipe_id] += 1
+        self.postings = {
+            ingredient_id: array('q', sorted(recipe_ids))
+            for ingredient_id, recipe_ids in postings.items()
+        }
+        self.tag_bits = {}
+        self.tags = defaultdict(int)
+        for recipe_id, tag_id in tags:
+            bit = self.tag_bits.setdefault(tag_id, 1 << len(self.tag_bits))
+            self.tags[recipe_id] |= bit
+
+    @classmethod
+    def load(cls, version):
+        return cls(
+            version,
+            Recipe.objects.values_list('id', 'cooking_time'),
+            IngredientRecipe.objects.values_list('recipe_id', 'ingredient_id'),
+            Recipe.tags.through.objects.values_list('recipe_id', 'tag_id')
+        )
+
+    def match(self, ingredient_ids, tag_ids=(), max_cooking_time=None):
+        matched = defaultdict(int)
+        for ingredient_id in set(ingredient_ids):
+            for recipe_id in self.postings.get(ingredient_id, ()):
+                matched[recipe_id] += 1
+        tags_mask = 0
+        for tag_id in tag_ids:
+            tags_mask |= self.tag_bits.get(tag_id, 0)
+        if tag_ids and not tags_mask:
+            return []
+        matches = [
+            Match(recipe_id, count, self.sizes[recipe_id])
+            for recipe_id, count in matched.items()
+            if (not tags_mask or self.tags[recipe_id] & tags_mask)
+            and (
+                max_cooking_time is None
+                or self.cooking_time.get(recipe_id, 0) <= max_cooking_time
+            )
+        ]
+        matches.sort(key=lambda match: (
+            -match.matched / match.total,
+            match.total - match.matched,
+            -match.recipe_id
+        ))
+        return matches
+
+
+_index = None
+
+
+def get_matching_index():
+    global _index
+    version = get_matching_version()
+    index = _index
+    if index is None or index.version != version:
+        index = _index = MatchingIndex.load(version)
+    return index
@@ -0,0 +1,64 @@
+from array import array
+from bisect import bisect_left
+
+from django.core.cache import cache
+
+from recipes.constants import MEMBERSHIP_CACHE_KEY
+from recipes.models import Favorite, ShoppingCart, Subscription
+
+
+def contains(ids, value):
+    index = bisect_left(ids, value)
+    return index < len(ids) and ids[index] == value
+
+
+def sorted_ids(queryset, field):
+    return array('q', sorted(queryset.values_list(field, flat=True)))
+
+
+class Membership:
+
+    def __init__(self, favorites=(), shopping_cart=(), following=()):
+        self.favorites = favorites
+        self.shopping_cart = shopping_cart
+        self.following = following
+
+    @classmethod
+    def for_user(cls, user):
+        if user.is_anonymous:
+            return cls()
+        key = MEMBERSHIP_CACHE_KEY.format(user.id)
+        membership = cache.get(key)
+        if membership is None:
+            membership = (
+                sorted_ids(Favorite.objects.filter(author=user), 'recipe_id'),
+                sorted_ids(
+                    ShoppingCart.objects.filter(author=user), 'recipe_id'
+                ),
+                sorted_ids(
+                    Subscription.objects.filter(user=user), 'following_id'
+                ),
+            )
+            cache.set(key, membership)
+        return cls(*membership)
+
+    def is_favorited(self, recipe_id):
+        return contains(self.favorites, recipe_id)
+
+    def is_in_shopping_cart(self, recipe_id):
+        return contains(self.shopping_cart, recipe_id)
+
+    def is_subscribed(self, author_id):
+        return contains(self.following, author_id)
+
+
+def get_membership(context):
+    if 'membership' not in context:
+        context['membership'] = Membership.for_user(
+            context['request'].user
+        )
+    return context['membership']
+
+
+def clear_membership_cache(user_id):
+    cache.delete(MEMBERSHIP_CACHE_KEY.format(user_id))
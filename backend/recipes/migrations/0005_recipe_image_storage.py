@@ -0,0 +1,19 @@
+# Generated by Django 3.2.3 on 2026-10-18 05:08
+
+from django.db import migrations, models
+import recipes.images
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_author_pub_date_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(default=None, storage=recipes.images.ContentHashStorage(), upload_to='recipes/image/', verbose_name='Изображение'),
+        ),
+    ]
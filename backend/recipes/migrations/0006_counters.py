@@ -0,0 +1,79 @@
+# Generated by Django 3.2.3 on 2026-10-18 05:17
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def count_subquery(model, field, outer_field='pk'):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                **{field: OuterRef(outer_field)}
+            ).order_by().values(field).annotate(
+                count=Count('pk')
+            ).values('count'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Recipe = apps.get_model('recipes', 'Recipe')
+    UserCounter = apps.get_model('recipes', 'UserCounter')
+    UserCounter.objects.bulk_create(
+        UserCounter(user_id=user_id)
+        for user_id in User.objects.values_list('id', flat=True)
+    )
+    Recipe.objects.update(
+        favorites_count=count_subquery(
+            apps.get_model('recipes', 'Favorite'), 'recipe'
+        ),
+        shopping_carts_count=count_subquery(
+            apps.get_model('recipes', 'ShoppingCart'), 'recipe'
+        )
+    )
+    UserCounter.objects.update(
+        recipes_count=count_subquery(Recipe, 'author', 'user'),
+        followers_count=count_subquery(
+            apps.get_model('recipes', 'Subscription'), 'following', 'user'
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0005_recipe_image_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counter', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('recipes_count', models.PositiveIntegerField(default=0, verbose_name='Рецептов')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+            ],
+            options={
+                'verbose_name': 'Счётчики пользователя',
+                'verbose_name_plural': 'Счётчики пользователей',
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в корзину'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
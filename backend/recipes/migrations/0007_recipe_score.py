@@ -0,0 +1,67 @@
+# Generated by Django 3.2.3 on 2026-10-18 05:19
+
+import math
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Копия формулы recipes.scores.popular_score на момент миграции, чтобы
+# последующие изменения кода не влияли на уже написанную миграцию.
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+POPULAR_SCORE_PERIOD = 45000
+
+
+def popular_score(total, pub_date):
+    return (
+        math.log10(max(total, 1))
+        + (pub_date - EPOCH).total_seconds() / POPULAR_SCORE_PERIOD
+    )
+
+
+def fill_scores(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeScore = apps.get_model('recipes', 'RecipeScore')
+    RecipeScore.objects.bulk_create(
+        RecipeScore(
+            recipe_id=recipe_id,
+            total=favorites + shopping_carts,
+            popular=popular_score(favorites + shopping_carts, pub_date)
+        )
+        for recipe_id, pub_date, favorites, shopping_carts
+        in Recipe.objects.values_list(
+            'id', 'pub_date', 'favorites_count', 'shopping_carts_count'
+        ).iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeScore',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Добавлений в избранное и корзину')),
+                ('popular', models.FloatField(default=0, verbose_name='Популярность')),
+                ('trending', models.FloatField(default=0, verbose_name='Рост популярности')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинги рецептов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-popular', '-recipe'], name='score_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-trending', '-recipe'], name='score_trending_idx'),
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.3 on 2026-10-18 05:22
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+CREATE_INDEX = (
+    "UPDATE recipes_recipe r SET search_vector = "
+    "setweight(to_tsvector('russian', r.name), 'A') "
+    "|| setweight(to_tsvector('russian', COALESCE(("
+    "SELECT string_agg(i.name, ' ') FROM recipes_ingredientrecipe ir "
+    "JOIN recipes_ingredient i ON i.id = ir.ingredient_id "
+    "WHERE ir.recipe_id = r.id), '')), 'B') "
+    "|| setweight(to_tsvector('russian', r.text), 'C');",
+    'CREATE INDEX IF NOT EXISTS recipe_search_vector_idx '
+    'ON recipes_recipe USING gin (search_vector);',
+)
+DROP_INDEX = ('DROP INDEX IF EXISTS recipe_search_vector_idx;',)
+
+
+def run_sql(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(run_sql(CREATE_INDEX), run_sql(DROP_INDEX)),
+    ]
@@ -1,8 +1,10 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
 from recipes.constants import (MAX_LEN_COLOR_TAG,
                                MAX_LEN_NAME_TAG_ING_RECIPE_MEASUREMENT_UNIT)
+from recipes.images import ContentHashStorage
 from recipes.validators import validate_time_amount
 
 User = get_user_model()
@@ -41,6 +43,25 @@ class Subscription(models.Model):
         return f'{self.user} подписан на {self.following}'
 
 
+class UserCounter(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counter',
+        verbose_name='Пользователь'
+    )
+    recipes_count = models.PositiveIntegerField('Рецептов', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self):
+        return f'Счётчики пользователя {self.user}'
+
+
 class Tag(models.Model):
     name = models.CharField(
         'Название', max_length=MAX_LEN_NAME_TAG_ING_RECIPE_MEASUREMENT_UNIT
@@ -86,7 +107,10 @@ class Recipe(models.Model):
         'Название', max_length=MAX_LEN_NAME_TAG_ING_RECIPE_MEASUREMENT_UNIT
     )
     image = models.ImageField(
-        'Изображение', upload_to='recipes/image/', default=None
+        'Изображение',
+        upload_to='recipes/image/',
+        storage=ContentHashStorage(),
+        default=None
     )
     text = models.TextField('Описание')
     cooking_time = models.SmallIntegerField(
@@ -101,16 +125,64 @@ class Recipe(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    favorites_count = models.PositiveIntegerField(
+        'Добавлений в избранное', default=0, editable=False
+    )
+    shopping_carts_count = models.PositiveIntegerField(
+        'Добавлений в корзину', default=0, editable=False
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор', null=True, editable=False
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'), name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=('author', '-pub_date'),
+                name='recipe_author_pub_date_idx'
+            ),
+        )
 
     def __str__(self):
         return self.name
 
 
+class RecipeScore(models.Model):
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score',
+        verbose_name='Рецепт'
+    )
+    total = models.PositiveIntegerField(
+        'Добавлений в избранное и корзину', default=0
+    )
+    popular = models.FloatField('Популярность', default=0)
+    trending = models.FloatField('Рост популярности', default=0)
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+        indexes = (
+            models.Index(
+                fields=('-popular', '-recipe'), name='score_popular_idx'
+            ),
+            models.Index(
+                fields=('-trending', '-recipe'), name='score_trending_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'Рейтинг рецепта {self.recipe}'
+
+
 class IngredientRecipe(models.Model):
     ingredient = models.ForeignKey(
         Ingredient,
@@ -131,6 +203,13 @@ class IngredientRecipe(models.Model):
         verbose_name = 'Ингредиенты рецептов'
         verbose_name_plural = 'Ингредиенты рецептов'
         ordering = ('recipe',)
+        indexes = (
+            models.Index(
+                fields=('recipe', 'ingredient'),
+                include=('amount',),
+                name='ingredient_recipe_amount_idx'
+            ),
+        )
 
     def __str__(self):
         return f'Ингредиент {self.ingredient} в рецепте {self.recipe}'
@@ -161,6 +240,11 @@ class Favorite(FavoriteShoppingCartModel):
                 name='unique_favorite'
             ),
         )
+        indexes = (
+            models.Index(
+                fields=('recipe', 'author'), name='favorite_recipe_author_idx'
+            ),
+        )
 
     def __str__(self):
         return f'Рецепт {self.recipe} добавлен у пользователя {self.author}'
@@ -178,6 +262,24 @@ class ShoppingCart(FavoriteShoppingCartModel):
                 name='unique_shopping_cart'
             ),
         )
+        indexes = (
+            models.Index(
+                fields=('recipe', 'author'), name='cart_recipe_author_idx'
+            ),
+        )
 
     def __str__(self):
         return f'Рецепт {self.recipe} добавлен у пользователя {self.author}'
+
+
+class Version(models.Model):
+    name = models.CharField('Название', max_length=50, primary_key=True)
+    value = models.PositiveBigIntegerField('Версия', default=1)
+    modified = models.DateTimeField('Изменена', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
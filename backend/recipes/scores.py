@@ -0,0 +1,70 @@
+import math
+from datetime import datetime
+from itertools import islice
+
+from django.db.models import F
+from django.utils import timezone
+
+from recipes.constants import (IMPORT_BATCH_SIZE, POPULAR_SCORE_PERIOD,
+                               TRENDING_HALF_LIFE)
+from recipes.models import Recipe, RecipeScore
+
+# Обе оценки считаются от фиксированной точки отсчёта, поэтому их не нужно
+# пересчитывать со временем: новые добавления весят больше старых.
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def popular_score(total, pub_date):
+    return (
+        math.log10(max(total, 1))
+        + (pub_date - EPOCH).total_seconds() / POPULAR_SCORE_PERIOD
+    )
+
+
+def trending_score(trending, delta, now):
+    if delta <= 0:
+        return trending
+    value = (
+        math.log2(delta)
+        + (now - EPOCH).total_seconds() / TRENDING_HALF_LIFE
+    )
+    if not trending:
+        return value
+    high, low = max(trending, value), min(trending, value)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def refresh_scores(batch_size=IMPORT_BATCH_SIZE, recipe_ids=None):
+    now = timezone.now()
+    recipes = Recipe.objects.all()
+    if recipe_ids is not None:
+        recipes = recipes.filter(pk__in=recipe_ids)
+    changed = recipes.annotate(
+        total=F('favorites_count') + F('shopping_carts_count')
+    ).exclude(score__total=F('total')).values_list(
+        'id', 'pub_date', 'total', 'score__total', 'score__trending'
+    ).iterator()
+    refreshed = 0
+    batch = list(islice(changed, batch_size))
+    while batch:
+        created, updated = [], []
+        for recipe_id, pub_date, total, old_total, trending in batch:
+            score = RecipeScore(
+                recipe_id=recipe_id,
+                total=total,
+                popular=popular_score(total, pub_date),
+                trending=trending_score(
+                    trending or 0, total - (old_total or 0), now
+                )
+            )
+            if old_total is None:
+                created.append(score)
+            else:
+                updated.append(score)
+        RecipeScore.objects.bulk_create(created, ignore_conflicts=True)
+        RecipeScore.objects.bulk_update(
+            updated, ('total', 'popular', 'trending')
+        )
+        refreshed += len(batch)
+        batch = list(islice(changed, batch_size))
+    return refreshed
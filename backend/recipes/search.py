@@ -0,0 +1,146 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection
+from django.db.models import (Case, F, IntegerField, OuterRef, Subquery, Value,
+                              When)
+
+from recipes.catalogue import get_recipes_version
+from recipes.constants import IMPORT_BATCH_SIZE, SEARCH_CONFIG
+from recipes.models import IngredientRecipe, Recipe
+
+WORD = re.compile(r'\w+')
+# Веса полей в запасном индексе соответствуют весам A, B и C в tsvector.
+NAME_WEIGHT = 3
+INGREDIENTS_WEIGHT = 2
+TEXT_WEIGHT = 1
+
+
+def tokenize(text):
+    return WORD.findall(text.lower())
+
+
+def get_ingredient_names(recipe_ids):
+    names = defaultdict(list)
+    for recipe_id, name in IngredientRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'ingredient__name'):
+        names[recipe_id].append(name)
+    return {
+        recipe_id: ' '.join(recipe_names)
+        for recipe_id, recipe_names in names.items()
+    }
+
+
+def update_search_vectors(recipe_ids):
+    if connection.vendor != 'postgresql':
+        return
+    # Названия ингредиентов собираются в том же UPDATE, что и в миграции
+    # 0008, а не отдельным запросом на каждый рецепт.
+    ingredients = IngredientRecipe.objects.filter(
+        recipe=OuterRef('pk')
+    ).order_by().values('recipe').annotate(
+        names=StringAgg('ingredient__name', ' ')
+    ).values('names')
+    Recipe.objects.filter(pk__in=recipe_ids).update(search_vector=(
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(
+            Subquery(ingredients), weight='B', config=SEARCH_CONFIG
+        )
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    ))
+
+
+def rebuild_search_vectors(batch_size=IMPORT_BATCH_SIZE, recipe_ids=None):
+    if recipe_ids is None:
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+    for start in range(0, len(recipe_ids), batch_size):
+        update_search_vectors(recipe_ids[start:start + batch_size])
+    return len(recipe_ids)
+
+
+class SearchIndex:
+
+    def __init__(self, version, documents):
+        self.version = version
+        postings = defaultdict(lambda: defaultdict(int))
+        for recipe_id, name, ingredients, text in documents:
+            for weight, field in (
+                (NAME_WEIGHT, name),
+                (INGREDIENTS_WEIGHT, ingredients),
+                (TEXT_WEIGHT, text),
+            ):
+                for token in tokenize(field):
+                    postings[token][recipe_id] += weight
+        self.tokens = sorted(postings)
+        self.postings = [dict(postings[token]) for token in self.tokens]
+
+    @classmethod
+    def load(cls, version):
+        recipes = Recipe.objects.values_list('id', 'name', 'text')
+        ingredients = get_ingredient_names(
+            [recipe_id for recipe_id, _, _ in recipes]
+        )
+        return cls(version, (
+            (recipe_id, name, ingredients.get(recipe_id, ''), text)
+            for recipe_id, name, text in recipes
+        ))
+
+    def search(self, query):
+        scores = None
+        for word in tokenize(query):
+            matches = defaultdict(int)
+            position = bisect_left(self.tokens, word)
+            while (
+                position < len(self.tokens)
+                and self.tokens[position].startswith(word)
+            ):
+                for recipe_id, weight in self.postings[position].items():
+                    matches[recipe_id] += weight
+                position += 1
+            if scores is not None:
+                matches = {
+                    recipe_id: score + matches[recipe_id]
+                    for recipe_id, score in scores.items()
+                    if recipe_id in matches
+                }
+            scores = matches
+        if not scores:
+            return []
+        return sorted(
+            scores, key=lambda recipe_id: (-scores[recipe_id], -recipe_id)
+        )
+
+
+_index = None
+
+
+def get_search_index():
+    global _index
+    version = get_recipes_version()
+    index = _index
+    if index is None or index.version != version:
+        index = _index = SearchIndex.load(version)
+    return index
+
+
+def search_recipes(queryset, query):
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(query, config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', '-id')
+    recipe_ids = get_search_index().search(query)
+    if not recipe_ids:
+        return queryset.none()
+    return queryset.filter(pk__in=recipe_ids).order_by(Case(
+        *(
+            When(pk=recipe_id, then=Value(position))
+            for position, recipe_id in enumerate(recipe_ids)
+        ),
+        output_field=IntegerField()
+    ))
@@ -0,0 +1,224 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from recipes.catalogue import (bump_matching_version, bump_recipes_version,
+                               bump_version)
+from recipes.constants import SHOPPING_CART_CACHE_KEY
+from recipes.counters import change_recipe_counter, change_user_counter
+from recipes.images import schedule_renditions
+from recipes.membership import clear_membership_cache
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            RecipeScore, ShoppingCart, Subscription, Tag, User,
+                            UserCounter)
+from recipes.scores import popular_score
+from recipes.search import update_search_vectors
+
+# Поля пользователя, которые выводятся в рецептах как автор.
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'shopping_carts_count',
+}
+
+# Пары полей «пользователь — объект» у избранного, корзины и подписок.
+RELATION_FIELDS = {
+    Favorite: ('author_id', 'recipe_id'),
+    ShoppingCart: ('author_id', 'recipe_id'),
+    Subscription: ('user_id', 'following_id'),
+}
+
+
+def update_deleted_relations(model, rows):
+    """Обновляет счётчики и кэши после удаления избранного, корзины или
+    подписок.
+
+    У этих моделей нет сигналов удаления, чтобы queryset.delete()
+    выполнялся одним запросом, поэтому удаляющий код вызывает функцию
+    явно.
+    """
+    for user_id, target_id in rows:
+        if model is Subscription:
+            change_user_counter(target_id, 'followers_count', -1)
+        else:
+            change_recipe_counter(target_id, RECIPE_COUNTERS[model], -1)
+        clear_membership_cache(user_id)
+        if model is ShoppingCart:
+            cache.delete(SHOPPING_CART_CACHE_KEY.format(user_id))
+
+
+@receiver(pre_delete, sender=Recipe)
+@receiver(pre_delete, sender=User)
+def forget_cascade_relations(sender, instance, **kwargs):
+    # Каскадное удаление не отправляет сигналов для связей.
+    field = 'recipe' if sender is Recipe else 'author'
+    for model in (Favorite, ShoppingCart):
+        update_deleted_relations(model, model.objects.filter(
+            **{field: instance}
+        ).values_list(*RELATION_FIELDS[model]))
+    if sender is User:
+        update_deleted_relations(Subscription, Subscription.objects.filter(
+            Q(user=instance) | Q(following=instance)
+        ).values_list(*RELATION_FIELDS[Subscription]))
+
+
+@receiver(post_save, sender=ShoppingCart)
+def clear_shopping_cart_cache(sender, instance, **kwargs):
+    cache.delete(SHOPPING_CART_CACHE_KEY.format(instance.author_id))
+
+
+def clear_recipe_shopping_carts_cache(recipe_id):
+    authors = ShoppingCart.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('author_id', flat=True)
+    cache.delete_many(
+        [SHOPPING_CART_CACHE_KEY.format(author) for author in authors]
+    )
+
+
+def update_recipes_composition(recipe_ids):
+    """Сбрасывает кэши, зависящие от состава рецептов, после коммита."""
+    def update():
+        for recipe_id in recipe_ids:
+            clear_recipe_shopping_carts_cache(recipe_id)
+        bump_recipes_version()
+        bump_matching_version()
+    transaction.on_commit(update)
+
+
+# Удаление ингредиентов рецепта не подписано на сигналы, чтобы Django
+# удалял их одним запросом. Сохранение рецепта и админка сбрасывают
+# зависимые кэши явно.
+@receiver(post_save, sender=IngredientRecipe)
+def clear_ingredient_recipe_cache(sender, instance, **kwargs):
+    clear_recipe_shopping_carts_cache(instance.recipe_id)
+
+
+@receiver(post_save, sender=Recipe)
+def clear_recipe_cache(sender, instance, created, **kwargs):
+    if not created:
+        recipe_id = instance.id
+        transaction.on_commit(
+            lambda: clear_recipe_shopping_carts_cache(recipe_id)
+        )
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def update_catalogue_version(sender, **kwargs):
+    transaction.on_commit(bump_version)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def clear_recipe_membership_cache(sender, instance, **kwargs):
+    clear_membership_cache(instance.author_id)
+
+
+@receiver(post_save, sender=Subscription)
+def clear_subscription_membership_cache(sender, instance, **kwargs):
+    clear_membership_cache(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def create_user_counter(sender, instance, created, **kwargs):
+    if created:
+        UserCounter.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def increment_recipe_counter(sender, instance, created, **kwargs):
+    if created:
+        change_recipe_counter(instance.recipe_id, RECIPE_COUNTERS[sender], 1)
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(sender, instance, created, **kwargs):
+    if created:
+        change_user_counter(instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_save, sender=Recipe)
+def create_recipe_score(sender, instance, created, **kwargs):
+    if created:
+        RecipeScore.objects.get_or_create(
+            recipe=instance,
+            defaults={'popular': popular_score(0, instance.pub_date)}
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(sender, instance, **kwargs):
+    change_user_counter(instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Subscription)
+def increment_followers_count(sender, instance, created, **kwargs):
+    if created:
+        change_user_counter(instance.following_id, 'followers_count', 1)
+
+
+@receiver(post_save, sender=Recipe)
+def create_image_renditions(sender, instance, **kwargs):
+    if instance.image:
+        name = instance.image.name
+        transaction.on_commit(lambda: schedule_renditions(name))
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(sender, instance, **kwargs):
+    recipe_id = instance.id
+    transaction.on_commit(lambda: update_search_vectors([recipe_id]))
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_search_vectors(sender, instance, created, **kwargs):
+    if created:
+        return
+    recipe_ids = list(IngredientRecipe.objects.filter(
+        ingredient=instance
+    ).values_list('recipe_id', flat=True))
+    transaction.on_commit(lambda: update_search_vectors(recipe_ids))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver(post_save, sender=IngredientRecipe)
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def update_recipes_version(sender, **kwargs):
+    transaction.on_commit(bump_recipes_version)
+
+
+# Индекс подбора рецептов зависит только от состава рецептов, их тегов
+# и времени приготовления.
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def update_matching_version(sender, **kwargs):
+    transaction.on_commit(bump_matching_version)
+
+
+@receiver(pre_save, sender=User)
+def check_author_fields(sender, instance, update_fields=None, **kwargs):
+    # Регистрация и вход сохраняют пользователя без изменения полей
+    # автора, такие сохранения не сбрасывают кэш рецептов.
+    fields = AUTHOR_FIELDS.intersection(update_fields or AUTHOR_FIELDS)
+    instance._author_changed = False
+    if instance._state.adding or not fields:
+        return
+    old = User.objects.filter(pk=instance.pk).values(*fields).first()
+    instance._author_changed = old is not None and any(
+        old[field] != getattr(instance, field) for field in fields
+    )
+
+
+@receiver(post_save, sender=User)
+def update_author_recipes_version(sender, instance, **kwargs):
+    if getattr(instance, '_author_changed', False):
+        transaction.on_commit(bump_recipes_version)